@@ -69,7 +69,7 @@ class Scrpt(object):
                 return None
             else:
                 job_name = scr_job
-                job_handle = self.methods[scr_job]
+                job_handle = methods[scr_job]
         elif isinstance(scr_job, types.MethodType):
             job_name = scr_job.__name__
             job_handle = scr_job
@@ -82,6 +82,16 @@ class Scrpt(object):
         self.log.info('job \'%s\' finished' % job_name)
         return retval
 
+    def watch(self, scr_job, paths, pattern='.*', n_changes=None, watch_opts=None, **kwargs):
+        """Run job on every batch of changed files: job(files=[...], **kwargs). Linux only, see watch.Watcher
+        pattern -- RE pattern of files to react on
+        n_changes -- stop after this number of job runs (None - watch forever)
+        watch_opts -- dict of watch.Watcher options: 'debounce', 'max_delay', 'recursive', 'events'"""
+        import watch
+        self.log.info('Watching %s for \'%s\' ...' % (paths, pattern))
+        return watch.watch(
+            paths, lambda files: self.job(scr_job, files=files, **kwargs), pattern, n_changes, **(watch_opts or {}))
+
     def upload_scrpt_stuff(self, scrpt_path, dst_path):
         foo = [os.path.join(scrpt_path, item) for item in os.listdir(scrpt_path) if item.endswith('.py')]
         self.util.rmt.upload(foo, dst_path)
@@ -1,9 +1,16 @@
+import os
+import os.path as osp
 import sys
 import copy
+import hashlib
+import mmap
+import numpy as np
 
 sys.path.extend(['/home/anton/design/scrpt', '/home/anton/design/ESCORT65/digital/design/tb'])
 
-from functools import reduce
+from functools import reduce, lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from operator import xor, getitem
 
 from log_util import get_logger
 
@@ -11,6 +18,93 @@ log = get_logger(__name__)
 log.setLevel("DEBUG")
 
 
+def gf2_mat_vec(mat, vec):
+    """
+    Multiply GF(2) matrix by vector.
+    'mat' - list of matrix columns, each column is an int bitmask. 'vec' - int bitmask.
+    """
+    foo = 0
+    for col in mat:
+        if vec & 1:
+            foo ^= col
+        vec >>= 1
+    return foo
+
+
+def gf2_mat_mul(mat_a, mat_b):
+    """Multiply GF(2) matrices given as lists of column bitmasks"""
+    return [gf2_mat_vec(mat_a, col) for col in mat_b]
+
+
+def gf2_mat_pow(mat, power):
+    """Raise square GF(2) matrix given as list of column bitmasks to non-negative 'power'"""
+    foo = [1 << i for i in range(len(mat))]  # identity
+    while power:
+        if power & 1:
+            foo = gf2_mat_mul(mat, foo)
+        power >>= 1
+        if power:
+            mat = gf2_mat_mul(mat, mat)
+    return foo
+
+
+def gen_crc_shift_matrix(polynomial):
+    """
+    Generate GF(2) matrix (list of column bitmasks) of single LFSR shift without data: crc_new = mat * crc.
+    """
+    n_crc = get_poly_width(polynomial)
+    mask = (1 << n_crc) - 1
+    feedback = (polynomial & mask) | 1
+    return [1 << (i + 1) for i in range(n_crc - 1)] + [feedback]
+
+
+@lru_cache(maxsize=64)
+def generate_vector_crc_masks(polynomial, n_data_bits, lsb=True):
+    """
+    Generate vector CRC calculation scheme based on 'polynomial' of size N <= 64 as bitmasks.
+    The same scheme as generate_vector_crc() builds, but every term is stored as int bitmask.
+
+    Args:
+        'polynomial'    -   (N+1)-bit polynomial representation (highest and lowest degrees are present)
+        'n_data_bits'   -   data vector width
+        'lsb' == True   -   Data is applied LSB else MSB.
+    Return:
+        Tuple[N] of (mask_c, mask_d): crc_new[j] = parity(crc & mask_c) ^ parity(data & mask_d)
+    """
+    n_crc = get_poly_width(polynomial)
+    mask = (1 << n_crc) - 1
+    feedback = (polynomial & mask) | 1
+
+    # crc_new = A^n_data_bits * crc ^ sum(A^(n_data_bits-1-k) * feedback * d[k-th applied bit])
+    c_cols = gf2_mat_pow(gen_crc_shift_matrix(polynomial), n_data_bits)
+    d_cols = [0] * n_data_bits
+    foo = feedback
+    for k in range(n_data_bits):
+        d_cols[n_data_bits - 1 - k if lsb else k] = foo
+        foo = ((foo << 1) & mask) ^ (feedback if foo >> (n_crc - 1) else 0)
+
+    # transpose columns to rows
+    masks = [[0, 0] for j in range(n_crc)]
+    for idx, cols in enumerate((c_cols, d_cols)):
+        for i, col in enumerate(cols):
+            while col:
+                bar = col & -col
+                masks[bar.bit_length() - 1][idx] |= 1 << i
+                col ^= bar
+    return tuple(tuple(item) for item in masks)
+
+
+def conv_crc_masks_2_scheme(crc_masks):
+    """
+    Convert generate_vector_crc_masks() scheme to generate_vector_crc() format:
+    List[N] of dict {'c': [..], d:[..]} with appropriate crc or data indices to be xor-ed.
+    """
+    def conv_mask_2_list(mask):
+        return [i for i in range(mask.bit_length()) if (mask >> i) & 1]
+
+    return [{'c': conv_mask_2_list(mask_c), 'd': conv_mask_2_list(mask_d)} for mask_c, mask_d in crc_masks]
+
+
 def generate_vector_crc(polynomial, n_data_bits, lsb=True):
     """
     Generate vector CRC calculation scheme based on 'polynomial' of size N <= 64.
@@ -29,48 +123,7 @@ def generate_vector_crc(polynomial, n_data_bits, lsb=True):
     n_data_bits = 8
     """
 
-    def update_crc_scheme(crc, idx_src, crc_new, idx_dst):
-        for foo in ['c', 'd']:
-            for bar in crc[idx_src][foo]:
-                if bar in crc_new[idx_dst][foo]:
-                    crc_new[idx_dst][foo].remove(bar)  # imitate xor of two same values
-                else:
-                    crc_new[idx_dst][foo].append(bar)
-            crc_new[idx_dst][foo].sort()  # just for better visualization
-
-    # convert polynomial to list of degrees
-    poly = []
-    for i in range(64 + 1):
-        poly.append(polynomial & 1)
-        polynomial = polynomial >> 1
-        if polynomial == 0:
-            break
-    poly = poly[:-1]
-    n_crc = len(poly)
-    assert n_crc > 0, "Too short 'Polynomial' length"
-    # log.debug(f'poly[0:{n_crc-1}] = {poly}')
-
-    crc_new = [{'c': [], 'd':[]} for i in range(n_crc)]
-    crc = [{'c': [i], 'd':[]} for i in range(n_crc)]
-    data_bits_range = range(n_data_bits) if lsb else reversed(range(n_data_bits))
-    for i in data_bits_range:
-        # crc bit #0
-        crc_new[0]['d'].append(i)
-        update_crc_scheme(crc, -1, crc_new, 0)
-
-        # rest of crc bits
-        for j in range(1, n_crc):
-            update_crc_scheme(crc, j-1, crc_new, j)  # previous crc bit
-            if poly[j] == 1:
-                # feedback
-                crc_new[j]['d'].append(i)
-                update_crc_scheme(crc, -1, crc_new, j)  # last(high) crc bit
-
-        crc = copy.deepcopy(crc_new)
-        crc_new = [{'c': [], 'd':[]} for i in range(n_crc)]
-    # for j in range(n_crc):  log.debug(f'crc scheme [{j}] = {crc[j]}')
-    return crc
-
+    return conv_crc_masks_2_scheme(generate_vector_crc_masks(polynomial, n_data_bits, lsb))
 
 
 def calc_vector_crc(data, data_width, crc_scheme, crc_init=0):
@@ -79,7 +132,7 @@ def calc_vector_crc(data, data_width, crc_scheme, crc_init=0):
     The order of Data processing (LSB or MSB ) is defined when 'crc_scheme' is generated
 
     Args:
-        'data'          - array of data_width-bit values.
+        'data'          - array of data_width-bit values or BitArray (split into data_width-bit values MSB first).
         'crc_scheme'    - Vector crc calculation scheme. May be generated by generate_vector_crc()
         'crc_init'      - N-bit init value. N = length(crc_scheme), is a size of CRC
     Return:
@@ -95,6 +148,8 @@ def calc_vector_crc(data, data_width, crc_scheme, crc_init=0):
         return qux
 
     assert isinstance(crc_scheme, (list, tuple)), "'crc_scheme' should be a list/tuple"
+    if isinstance(data, BitArray):
+        data = data.to_words(data_width).tolist()
     assert isinstance(data, (list, tuple)), "'data' should be a list/tuple"
     assert isinstance(crc_init, int), "'crc_init' should be an int"
 
@@ -113,17 +168,76 @@ def calc_vector_crc(data, data_width, crc_scheme, crc_init=0):
     return crc_value
 
 
+def conv_crc_scheme_2_matrix(crc_scheme, data_width):
+    """
+    Convert vector CRC calculation scheme into GF(2) matrices.
+
+    Args:
+        'crc_scheme'    - Vector crc calculation scheme. May be generated by generate_vector_crc()
+        'data_width'    - data vector width
+    Return:
+        (mat_d, mat_c) - uint8 arrays [N, data_width] and [N, N]: crc_new = mat_d * d ^ mat_c * crc
+    """
+    assert isinstance(crc_scheme, (list, tuple)), "'crc_scheme' should be a list/tuple"
+    crc_size = len(crc_scheme)
+    mat_d = np.zeros((crc_size, data_width), dtype=np.uint8)
+    mat_c = np.zeros((crc_size, crc_size), dtype=np.uint8)
+    for j, foo in enumerate(crc_scheme):
+        mat_d[j, foo['d']] = 1
+        mat_c[j, foo['c']] = 1
+    return mat_d, mat_c
+
+
+def calc_batch_crc(data, data_width, crc_scheme, crc_init=0):
+    """
+    Calculate vector CRC of many messages at once based on 'crc_scheme' generated in advance.
+    The order of Data processing (LSB or MSB ) is defined when 'crc_scheme' is generated.
+
+    Args:
+        'data'          - 2-D array [n_messages, n_words] of data_width-bit values. data_width <= 64.
+        'crc_scheme'    - Vector crc calculation scheme. May be generated by generate_vector_crc()
+        'crc_init'      - N-bit init value or array [n_messages] of them. N = length(crc_scheme), is a size of CRC
+    Return:
+        uint64 array [n_messages] of N-bit CRC values
+    """
+    data = np.asarray(data, dtype=np.uint64)
+    assert data.ndim == 2, "'data' should be a 2-D array [n_messages, n_words]"
+    assert 0 < data_width <= 64, "'data_width' should be in range [1, 64]"
+    crc_size = len(crc_scheme)
+    n_messages, n_words = data.shape
+
+    # crc_new = [d, crc] * [mat_d, mat_c].T mod 2. float32 matmul is exact here: sums never exceed data_width + N
+    mat_d, mat_c = conv_crc_scheme_2_matrix(crc_scheme, data_width)
+    mat = np.concatenate((mat_d, mat_c), axis=1).T.astype(np.float32)
+    d_shifts = np.arange(data_width, dtype=np.uint64)
+    c_shifts = np.arange(crc_size, dtype=np.uint64)
+
+    crc_init = np.broadcast_to(np.asarray(crc_init, dtype=np.uint64), (n_messages,))
+    crc = ((crc_init[:, None] >> c_shifts) & 1).astype(np.float32)
+    foo = np.empty((n_messages, data_width + crc_size), dtype=np.float32)
+    for idx in range(n_words):
+        foo[:, :data_width] = (data[:, idx, None] >> d_shifts) & 1
+        foo[:, data_width:] = crc
+        crc = np.fmod(foo @ mat, 2)
+
+    return np.bitwise_or.reduce(crc.astype(np.uint64) << c_shifts, axis=1)
+
+
 def calc_crc(data, polynomial, crc_init):
     """
     Calculate N-bit CRC based on 'polynomial'. N <= 64.
     We use scheme which requires 'n shifts for n bits' i.e. doesn't require additional shifts at the end.
     For example: Polynomial = 0x149F <=> x^12 + x^10 + x^7 + x^4 + x^3 + x^2 + x^1 + 1
-    'data' - array of 1-bit values. LSB-first (the first serial bit applied to LSFR is data[0]).
+    'data' - array of 1-bit values (string or BitArray). LSB-first (the first serial bit applied to LSFR is data[0]).
     'polynomial' - (N+1)-bit polynomial representation (highest and lowest degrees are present)
     'crc_init' - N-bit init value
     """
-    assert isinstance(data, str), "'data' should be a string of bits"
     assert isinstance(crc_init, int), "'crc_init' should be an int"
+    if isinstance(data, BitArray):  # packed bits: table engine gives the same result without per-bit lists
+        crc = Crc(polynomial, crc_init)
+        crc.update(data)
+        return crc.crc
+    assert isinstance(data, str), "'data' should be a string of bits"
     data = [int(item) for item in list(data)]
     # log.debug(f'data = {data}')
     # log.debug(f'polynomial = 0x{polynomial:0x}')
@@ -160,125 +274,109 @@ def calc_crc(data, polynomial, crc_init):
     return crc_val
 
 
+def generate_crc_func_source(crc_masks, data_width, func_name):
+    """
+    Generate python source of function 'func_name(data, crc_init)' calculating vector CRC based on 'crc_masks'.
+    Data word and CRC are combined once per word: x = (data << n_crc) | crc,
+    every CRC bit is calculated as parity of x & ((mask_d << n_crc) | mask_c).
+
+    Args:
+        'crc_masks'     - Vector crc calculation scheme. May be generated by generate_vector_crc_masks()
+        'data_width'    - data vector width
+        'func_name'     - name of generated function
+    Return:
+        Source code string
+    """
+    assert isinstance(crc_masks, (list, tuple)), "'crc_masks' should be a list/tuple"
+    n_crc = len(crc_masks)
+    n_x = (data_width + n_crc + 3) // 4
+    crc_bits = []
+    for j, (mask_c, mask_d) in enumerate(crc_masks):
+        crc_bits.append(f'(((x & 0x{(mask_d << n_crc) | mask_c:0{n_x}x}).bit_count() & 1) << {j})')
+    crc_bits = ' |\n            '.join(crc_bits)
+    return f'''# Generated by calculate_crc.generate_crc_func_source(). Do not edit.
+
+
+def {func_name}(data, crc_init):
+    crc = crc_init
+    for d in data:
+        x = (d << {n_crc}) | crc
+        crc = (
+            {crc_bits})
+    return crc
+'''
+
+
+# generated CRC functions are stored here to be reused by next runs
+crc_func_cache_dir = osp.join(osp.expanduser('~'), '.cache', 'scrpt', 'crc')
+crc_func_format_version = 3  # increment on generate_crc_func_source() output change
+
+
+@lru_cache(maxsize=None)
+def generate_crc_func(polynomial, n_data_bits, lsb=True):
+    """
+    Generate specialized function 'func(data, crc_init)' calculating CRC of array of n_data_bits-bit values.
+    Source is generated from generate_vector_crc_masks() scheme, compiled with exec and cached on disk.
+
+    Args:
+        'polynomial'    -   (N+1)-bit polynomial representation (highest and lowest degrees are present)
+        'n_data_bits'   -   data vector width
+        'lsb' == True   -   Data is applied LSB else MSB.
+    Return:
+        Generated function
+    """
+    func_name = f"crc_{get_poly_width(polynomial)}_0x{polynomial:X}_d{n_data_bits}_{'lsb' if lsb else 'msb'}"
+    crc_masks = generate_vector_crc_masks(polynomial, n_data_bits, lsb)
+    # cache file is bound to generator version and scheme: stale/foreign source is never used
+    key = hashlib.sha1(f'{crc_func_format_version} {crc_masks}'.encode()).hexdigest()[:16]
+    path2file = osp.join(crc_func_cache_dir, f'{func_name}_{key}.py')
+    src = None
+    if osp.isfile(path2file):
+        with open(path2file, 'r') as fid:
+            header, foo, body = fid.read().partition('\n')
+        if header == f'# {hashlib.sha1(body.encode()).hexdigest()}':  # edited/truncated file is regenerated
+            src = body
+    if src is None:
+        src = generate_crc_func_source(crc_masks, n_data_bits, func_name)
+        try:
+            os.makedirs(crc_func_cache_dir, exist_ok=True)
+            foo = f'{path2file}.{os.getpid()}'
+            with open(foo, 'w') as fid:
+                fid.write(f'# {hashlib.sha1(src.encode()).hexdigest()}\n{src}')
+            os.replace(foo, path2file)
+        except OSError as e:
+            log.warning(f"Can't cache '{func_name}': {e}")
+
+    namespace = {}
+    exec(compile(src, path2file, 'exec'), namespace)
+    return namespace[func_name]
+
+
 def crc_12_0x149F(data, crc_init):
     """
     Calculate 12-bit CRC: x^12 + x^10 + x^7 + x^4 + x^3 + x^2 + x^1 + 1
-    'data' - array of 12-bit values. MSB-first (the first serial bit applied to LSFR is data[i][11]).
+    'data' - array of 12-bit values or BitArray. MSB-first (the first serial bit applied to LSFR is data[i][11]).
     'crc_init' - 12-bit init int value
     """
+    if isinstance(data, BitArray):
+        data = data.to_words(12).tolist()
     assert isinstance(data, (list, tuple)), "'data' should be a list/tuple"
     assert isinstance(crc_init, int), "'crc_init' should be an int"
+    return generate_crc_func(0x149F, 12, lsb=False)(data, crc_init)
 
-    def rdc_xor(a, b):
-        return a ^ b
-
-    ci = [(crc_init >> i) & 1 for i in range(12)]
-    # log.debug(f"{ci}")
-
-    for item in data:
-        # log.debug(f'{item:0x}')
-        d = [(item >> i) & 1 for i in range(12)]
-        # log.debug(f"{d}")
-        ci1 = []
-        ci1.append(reduce(rdc_xor, (
-            d[11], d[10], d[6], d[5], d[4], d[2], d[0],
-            ci[11], ci[10], ci[6], ci[5], ci[4], ci[2], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[7], d[4], d[3], d[2], d[1], d[0],
-            ci[10], ci[7], ci[4], ci[3], ci[2], ci[1], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[8], d[6], d[3], d[1], d[0],
-            ci[10], ci[8], ci[6], ci[3], ci[1], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[9], d[7], d[6], d[5], d[1], d[0],
-            ci[10], ci[9], ci[7], ci[6], ci[5], ci[1], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[8], d[7], d[5], d[4], d[1], d[0],
-            ci[8], ci[7], ci[5], ci[4], ci[1], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[9], d[8], d[6], d[5], d[2], d[1],
-            ci[9], ci[8], ci[6], ci[5], ci[2], ci[1])))
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[9], d[7], d[6], d[3], d[2],
-            ci[10], ci[9], ci[7], ci[6], ci[3], ci[2])))
-        ci1.append(reduce(rdc_xor, (
-            d[8], d[7], d[6], d[5], d[3], d[2], d[0],
-            ci[8], ci[7], ci[6], ci[5], ci[3], ci[2], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[9], d[8], d[7], d[6], d[4], d[3], d[1],
-            ci[9], ci[8], ci[7], ci[6], ci[4], ci[3], ci[1])))
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[9], d[8], d[7], d[5], d[4], d[2],
-            ci[10], ci[9], ci[8], ci[7], ci[5], ci[4], ci[2])))
-        ci1.append(reduce(rdc_xor, (
-            d[9], d[8], d[4], d[3], d[2], d[0],
-            ci[9], ci[8], ci[4], ci[3], ci[2], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[9], d[5], d[4], d[3], d[1],
-            ci[10], ci[9], ci[5], ci[4], ci[3], ci[1])))
-        ci = ci1.copy()
-        # log.debug(f'crc [0:{12}] = 0x{reduce(lambda a, b: a + b, [ci[i] << i for i in range(12)]):03x}')
-
-    ci = [ci[i] << i for i in range(12)]
-    crc_value = reduce(lambda a, b: a + b, ci)
-    # log.debug(f"0x{crc_value:03x} <=> 0b{crc_value:012b}")
-    return crc_value
 
 def crc_12_0x120D(data, crc_init):
     """
     Calculate 12-bit CRC: x^12 + x^9 + x^3 + x^2 + 1
-    'data' - array of 12 bit value. MSB-first (the first serial bit applied to LSFR is data[i][11]).
+    'data' - array of 12 bit value or BitArray. MSB-first (the first serial bit applied to LSFR is data[i][11]).
     'crc_init' - 12-bit init int value
     """
+    if isinstance(data, BitArray):
+        data = data.to_words(12).tolist()
     assert isinstance(data, (list, tuple)), "'data' should be a list/tuple"
     assert isinstance(crc_init, int), "'crc_init' should be an int"
+    return generate_crc_func(0x120D, 12, lsb=False)(data, crc_init)
 
-    def rdc_xor(a, b):
-        return a ^ b
-
-    ci = [(crc_init >> i) & 1 for i in range(12)]
-    # log.debug(f"{ci}")
-
-    for item in data:
-        # log.debug(f'{item:0x}')
-        d = [(item >> i) & 1 for i in range(12)]
-        # log.debug(f"{d}")
-        ci1 = []
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[6], d[3], d[0], ci[10], ci[6], ci[3], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[11], d[7], d[4], d[1], ci[11], ci[7], ci[4], ci[1])))
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[8], d[6], d[5], d[3], d[2], d[0],
-            ci[10], ci[8], ci[6], ci[5], ci[3], ci[2], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[11], d[10], d[9], d[7], d[4], d[1], d[0],
-            ci[11], ci[10], ci[9], ci[7], ci[4], ci[1], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[11], d[10], d[8], d[5], d[2], d[1],
-            ci[11], ci[10], ci[8], ci[5], ci[2], ci[1])))
-        ci1.append(reduce(rdc_xor, (
-            d[11], d[9], d[6], d[3], d[2],
-            ci[11], ci[9], ci[6], ci[3], ci[2])))
-        ci1.append(reduce(rdc_xor, (
-            d[10], d[7], d[4], d[3], ci[10], ci[7], ci[4], ci[3])))
-        ci1.append(reduce(rdc_xor, (
-            d[11], d[8], d[5], d[4], ci[11], ci[8], ci[5], ci[4])))
-        ci1.append(reduce(rdc_xor, (
-            d[9], d[6], d[5], ci[9], ci[6], ci[5])))
-        ci1.append(reduce(rdc_xor, (
-            d[7], d[3], d[0], ci[7], ci[3], ci[0])))
-        ci1.append(reduce(rdc_xor, (
-            d[8], d[4], d[1], ci[8], ci[4], ci[1])))
-        ci1.append(reduce(rdc_xor, (
-            d[9], d[5], d[2], ci[9], ci[5], ci[2])))
-        ci = ci1.copy()
-        # log.debug(f"{ci}")
-
-    ci = [ci[i] << i for i in range(12)]
-    ci = reduce(lambda a, b: a + b, ci)
-    # log.debug(f"0x{ci:0x} <=> 0b{ci:012b}")
-    return ci
 
 def conv_wordlist_2_bitstring(inp, word_width=8, dir=0):
     """Convert list of bytes to bit string and vice versa
@@ -316,6 +414,408 @@ def conv_wordlist_2_bitstring(inp, word_width=8, dir=0):
         return wordlist
 
 
+class BitArray(object):
+    """Class "BitArray" - packed bit stream. Bit #0 of the stream is MSB of data[0] (the same order as conv_wordlist_2_bitstring())"""
+
+    chunk_size = 1 << 20  # words converted at once, keeps temporary numpy arrays small. Should be multiple of 8
+
+    def __init__(self, data=b'', n_bits=None):
+        """
+        data -- packed bits
+        n_bits -- stream length. By default - all bits of 'data'
+        """
+        self.data = bytearray(data)
+        self.n_bits = 8 * len(self.data) if n_bits is None else n_bits
+        assert 0 <= self.n_bits <= 8 * len(self.data), "'n_bits' doesn't match 'data' size"
+
+    def __len__(self):
+        return self.n_bits
+
+    def __eq__(self, other):
+        if not isinstance(other, BitArray) or self.n_bits != other.n_bits:
+            return False
+        return self.split_tail()[:2] == other.split_tail()[:2]
+
+    @classmethod
+    def from_words(cls, words, word_width=8, lsb=False):
+        """
+        Pack array of word_width-bit values. word_width <= 64.
+        'lsb' == True   -   bit #0 of every word goes first else bit #(word_width-1).
+        """
+        assert 0 < word_width <= 64, "'word_width' should be in range [1, 64]"
+        words = np.asarray(words, dtype=np.uint64).ravel()
+        assert words.size == 0 or int(words.max()) < (1 << word_width), "Too large word magnitude detected!"
+        shifts = np.arange(word_width, dtype=np.uint64)
+        shifts = shifts if lsb else shifts[::-1]
+        foo = bytearray()
+        for idx in range(0, words.size, cls.chunk_size):
+            bits = ((words[idx:idx + cls.chunk_size, None] >> shifts) & 1).astype(np.uint8)
+            foo += np.packbits(bits).tobytes()
+        return cls(foo, words.size * word_width)
+
+    @classmethod
+    def from_bitstring(cls, bitstr):
+        """Pack string of bits (see conv_wordlist_2_bitstring())"""
+        assert isinstance(bitstr, str), "'bitstr' should be a string"
+        bits = np.frombuffer(bitstr.encode('ascii'), dtype=np.uint8) - ord('0')
+        assert bits.size == 0 or int(bits.max()) <= 1, "'bitstr' should contain '0'/'1' only"
+        return cls(np.packbits(bits).tobytes(), bits.size)
+
+    def to_words(self, word_width=8, lsb=False):
+        """
+        Split stream into word_width-bit values. The last word is padded with zeros. word_width <= 64.
+        Return:
+            uint64 array of words
+        """
+        assert 0 < word_width <= 64, "'word_width' should be in range [1, 64]"
+        n_words = -(-self.n_bits // word_width)
+        shifts = np.arange(word_width, dtype=np.uint64)
+        shifts = shifts if lsb else shifts[::-1]
+        foo = np.empty(n_words, dtype=np.uint64)
+        data = np.frombuffer(self.data, dtype=np.uint8)
+        for idx in range(0, n_words, self.chunk_size):
+            n_bits = min(self.chunk_size * word_width, self.n_bits - idx * word_width)
+            bits = np.zeros(min(self.chunk_size, n_words - idx) * word_width, dtype=np.uint64)
+            bits[:n_bits] = np.unpackbits(data[idx * word_width // 8:], count=n_bits)
+            foo[idx:idx + self.chunk_size] = np.bitwise_or.reduce(bits.reshape(-1, word_width) << shifts, axis=1)
+        return foo
+
+    def to_bitstring(self):
+        """Convert to string of bits (see conv_wordlist_2_bitstring())"""
+        bits = np.unpackbits(np.frombuffer(self.data, dtype=np.uint8), count=self.n_bits)
+        return (bits + ord('0')).tobytes().decode('ascii')
+
+    def tobytes(self):
+        """Packed bits. The last byte is padded with zeros"""
+        return bytes(self.data[:(self.n_bits + 7) // 8])
+
+    def split_tail(self):
+        """
+        Return:
+            (memoryview, tail, n_tail_bits) - full bytes of the stream and the last n_tail_bits < 8 bits
+        """
+        n_bytes, n_tail = divmod(self.n_bits, 8)
+        tail = self.data[n_bytes] >> (8 - n_tail) if n_tail else 0
+        return memoryview(self.data)[:n_bytes], tail, n_tail
+
+
+# bit-reverse table for a byte: REV8[0b00000001] = 0b10000000
+REV8 = bytes(int(f'{i:08b}'[::-1], 2) for i in range(256))
+
+
+def get_poly_width(polynomial):
+    """
+    Return N - size of CRC defined by (N+1)-bit 'polynomial'. N <= 64.
+    """
+    assert isinstance(polynomial, int), "'polynomial' should be an int"
+    n_crc = polynomial.bit_length() - 1
+    assert n_crc > 0, "Too short 'Polynomial' length"
+    assert n_crc <= 64, "Too long 'Polynomial' length"
+    return n_crc
+
+
+@lru_cache(maxsize=None)
+def generate_crc_table(polynomial, n_slices=1):
+    """
+    Generate lookup tables for byte-wise (n_slices == 1) or slice-by-N CRC calculation.
+    Register is left-aligned to 'width' = max(N, 8 * n_slices) bits, so any N <= 64 is supported.
+
+    Args:
+        'polynomial'    -   (N+1)-bit polynomial representation (highest and lowest degrees are present)
+        'n_slices'      -   number of bytes processed per lookup step
+    Return:
+        (width, tables) where tables[k][i] - register value after shifting byte 'i' followed by k zero bytes
+    """
+    assert n_slices > 0, "'n_slices' should be a positive value"
+    n_crc = get_poly_width(polynomial)
+    width = max(n_crc, 8 * n_slices)
+    mask = (1 << width) - 1
+    top = 1 << (width - 1)
+    poly = (polynomial << (width - n_crc)) & mask
+
+    table = []
+    for i in range(256):
+        crc = i << (width - 8)
+        for j in range(8):
+            crc = ((crc << 1) & mask) ^ poly if crc & top else (crc << 1)
+        table.append(crc)
+    tables = [tuple(table)]
+    for k in range(1, n_slices):
+        tables.append(tuple(((crc << 8) & mask) ^ table[crc >> (width - 8)] for crc in tables[-1]))
+    return width, tuple(tables)
+
+
+@lru_cache(maxsize=None)
+def generate_crc_bit_table(polynomial, n_bits, width):
+    """
+    Generate lookup table to shift 'n_bits' < 8 bits into 'width'-bit left-aligned register.
+    Used to process tails which don't fill a whole byte.
+    """
+    assert 0 < n_bits <= 8, "'n_bits' should be in range [1, 8]"
+    n_crc = get_poly_width(polynomial)
+    mask = (1 << width) - 1
+    top = 1 << (width - 1)
+    poly = (polynomial << (width - n_crc)) & mask
+
+    table = []
+    for i in range(1 << n_bits):
+        crc = i << (width - n_bits)
+        for j in range(n_bits):
+            crc = ((crc << 1) & mask) ^ poly if crc & top else (crc << 1)
+        table.append(crc)
+    return tuple(table)
+
+
+def pack_words(data, word_width=8, lsb=False):
+    """
+    Pack array of word_width-bit values into serial bit stream.
+    'lsb' == True   -   bit #0 of every word goes first else bit #(word_width-1).
+    Return:
+        (bytes, tail, n_tail_bits) - full bytes of the stream and the last n_tail_bits < 8 bits
+    """
+    assert word_width > 0, "'word_width' should be a positive value"
+    if word_width % 8 == 0:
+        n_bytes = word_width // 8
+        if lsb:
+            foo = b''.join(item.to_bytes(n_bytes, 'little') for item in data).translate(REV8)
+        else:
+            foo = bytes(data) if 1 == n_bytes else b''.join(item.to_bytes(n_bytes, 'big') for item in data)
+        return foo, 0, 0
+
+    n_rev = (word_width + 7) // 8
+    foo = bytearray()
+    acc = 0
+    n_acc = 0
+    for item in data:
+        assert 0 <= item < (1 << word_width), "Too large word magnitude detected!"
+        if lsb:
+            item = int.from_bytes(item.to_bytes(n_rev, 'little').translate(REV8), 'big') >> (8 * n_rev - word_width)
+        acc = (acc << word_width) | item
+        n_acc += word_width
+        while n_acc >= 8:
+            n_acc -= 8
+            foo.append(acc >> n_acc)
+            acc &= (1 << n_acc) - 1
+    return bytes(foo), acc, n_acc
+
+
+def _crc_update_bytes(crc, data, width, tables):
+    """Shift bytes of 'data' into left-aligned 'width'-bit register 'crc' (MSB of each byte first)"""
+    mask = (1 << width) - 1
+    n_slices = len(tables)
+    t0 = tables[0]
+    n_full = len(data) - len(data) % n_slices if n_slices > 1 else 0
+    if n_full:
+        n_block = 8 * n_slices
+        rtables = tables[::-1]  # the first byte of a block is looked up in tables[n_slices-1]
+        for idx in range(0, n_full, n_slices):
+            foo = ((crc >> (width - n_block)) ^ int.from_bytes(data[idx:idx + n_slices], 'big')).to_bytes(n_slices, 'big')
+            crc = reduce(xor, map(getitem, rtables, foo), (crc << n_block) & mask)
+    for byte in data[n_full:] if n_full else data:
+        crc = ((crc << 8) & mask) ^ t0[(crc >> (width - 8)) ^ byte]
+    return crc
+
+
+def _crc_update_bits(crc, value, n_bits, polynomial, width):
+    """Shift 'n_bits' < 8 bits of 'value' into left-aligned 'width'-bit register 'crc' (MSB first)"""
+    if n_bits == 0:
+        return crc
+    table = generate_crc_bit_table(polynomial, n_bits, width)
+    mask = (1 << width) - 1
+    return ((crc << n_bits) & mask) ^ table[((crc >> (width - n_bits)) ^ value) & ((1 << n_bits) - 1)]
+
+
+def calc_table_crc(data, polynomial, crc_init, word_width=8, lsb=False, n_slices=16):
+    """
+    Calculate N-bit CRC using lookup tables (byte-wise or slice-by-N). N <= 64.
+    Bit-exact with calc_crc(), calc_vector_crc(), crc_12_0x149F() and crc_12_0x120D().
+
+    Args:
+        'data'          -   bytes/bytearray/memoryview (8-bit words),
+                            list/tuple of word_width-bit values,
+                            or string of bits/BitArray (the same as calc_crc() input, 'word_width' and 'lsb' are ignored)
+        'polynomial'    -   (N+1)-bit polynomial representation (highest and lowest degrees are present)
+        'crc_init'      -   N-bit init value
+        'word_width'    -   width of list/tuple items
+        'lsb' == True   -   Data words are applied LSB first else MSB first.
+        'n_slices'      -   number of bytes processed per lookup step
+    Return:
+        N-bit CRC value
+    """
+    crc = Crc(polynomial, crc_init, lsb, n_slices)
+    crc.update(data, word_width)
+    return crc.crc
+
+
+class Crc(object):
+    """Class "Crc" - incremental N-bit CRC calculation in hashlib manner: update(chunk), digest()"""
+
+    chunk_size = 1 << 20  # LSB-first data is bit-reversed by chunks of this size
+
+    def __init__(self, polynomial, crc_init=0, lsb=False, n_slices=16):
+        """
+        polynomial -- (N+1)-bit polynomial representation (highest and lowest degrees are present). N <= 64
+        crc_init -- N-bit init value
+        lsb -- data words are applied LSB first else MSB first
+        n_slices -- number of bytes processed per lookup step
+        """
+        assert isinstance(crc_init, int), "'crc_init' should be an int"
+        self.polynomial = polynomial
+        self.n_crc = get_poly_width(polynomial)
+        assert 0 <= crc_init < (1 << self.n_crc), "Too large 'crc_init' magnitude detected!"
+        self.lsb = lsb
+        self.width, self.tables = generate_crc_table(polynomial, n_slices)
+        self.name = f'crc{self.n_crc}_0x{polynomial:X}'
+        self.digest_size = (self.n_crc + 7) // 8
+        self.register = crc_init << (self.width - self.n_crc)  # left-aligned LFSR
+
+    def update(self, data, word_width=8):
+        """
+        Apply next chunk of data.
+        data -- bytes/bytearray/memoryview/mmap (8-bit words),
+                list/tuple of word_width-bit values,
+                or string of bits/BitArray (the same as calc_crc() input, 'word_width' and 'lsb' are ignored)
+        """
+        tail = n_tail = 0
+        reverse = False  # bytes-like data is applied as is
+        if isinstance(data, str):
+            n_tail = len(data) % 8
+            foo = int(data, 2) if data else 0
+            tail = foo & ((1 << n_tail) - 1)
+            data = (foo >> n_tail).to_bytes(len(data) // 8, 'big')
+        elif isinstance(data, BitArray):
+            data, tail, n_tail = data.split_tail()
+        elif isinstance(data, (list, tuple)):
+            data, tail, n_tail = pack_words(data, word_width, self.lsb)
+        elif isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+            data = memoryview(data).cast('B') if not isinstance(data, (bytes, bytearray)) else data
+            reverse = self.lsb
+        else:
+            assert False, "'data' should be a bytes-like object, list/tuple or string of bits"
+
+        if reverse:
+            for idx in range(0, len(data), self.chunk_size):
+                foo = bytes(data[idx:idx + self.chunk_size]).translate(REV8)
+                self.register = _crc_update_bytes(self.register, foo, self.width, self.tables)
+        else:
+            self.register = _crc_update_bytes(self.register, data, self.width, self.tables)
+        self.register = _crc_update_bits(self.register, tail, n_tail, self.polynomial, self.width)
+
+    @property
+    def crc(self):
+        """N-bit CRC value of data applied so far"""
+        return self.register >> (self.width - self.n_crc)
+
+    def digest(self):
+        return self.crc.to_bytes(self.digest_size, 'big')
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+    def copy(self):
+        return copy.copy(self)
+
+
+@lru_cache(maxsize=64)
+def gen_crc_zeros_matrix(polynomial, n_bits):
+    """Generate GF(2) matrix (list of column bitmasks) of 'n_bits' LFSR shifts without data"""
+    return gf2_mat_pow(gen_crc_shift_matrix(polynomial), n_bits)
+
+
+def crc_combine(crc_a, crc_b, len_b, polynomial):
+    """
+    Calculate CRC of concatenated data A + B using CRCs of its parts.
+
+    Args:
+        'crc_a'         -   N-bit CRC of A (calculated with any init value)
+        'crc_b'         -   N-bit CRC of B calculated with crc_init = 0
+        'len_b'         -   length of B in bytes
+        'polynomial'    -   (N+1)-bit polynomial representation (highest and lowest degrees are present)
+    Return:
+        N-bit CRC of A + B (with the same init value as 'crc_a')
+    """
+    return gf2_mat_vec(gen_crc_zeros_matrix(polynomial, 8 * len_b), crc_a) ^ crc_b
+
+
+def _calc_chunk_crc(data, polynomial, crc_init, lsb, n_slices):
+    """Process pool worker: CRC of bytes-like chunk"""
+    crc = Crc(polynomial, crc_init, lsb, n_slices)
+    crc.update(data)
+    return crc.crc
+
+
+def _calc_file_chunk_crc(path2file, offset, length, polynomial, crc_init, lsb, n_slices):
+    """Process pool worker: CRC of file[offset: offset + length] using mmap"""
+    crc = Crc(polynomial, crc_init, lsb, n_slices)
+    if length > 0:
+        with open(path2file, 'rb') as fid, mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as foo:
+                crc.update(foo[offset:offset + length])
+    return crc.crc
+
+
+def _calc_chunks_crc(chunks, polynomial, crc_init, n_workers):
+    """
+    Calculate CRC of every chunk in process pool and combine them in order.
+    'chunks' - list of (chunk_length, (worker, *worker_args)). Worker returns chunk CRC calculated with crc_init = 0
+    """
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(*job) for length, job in chunks]
+        crc = crc_init
+        for (length, job), future in zip(chunks, futures):
+            crc = crc_combine(crc, future.result(), length, polynomial)
+    return crc
+
+
+def calc_parallel_crc(data, polynomial, crc_init=0, lsb=False, n_slices=16, n_workers=None, chunk_size=None):
+    """
+    Calculate N-bit CRC of bytes-like or BitArray 'data' splitting it into chunks processed in parallel by process pool.
+    Partial CRCs are combined by crc_combine(). Result is the same as calc_table_crc() one ('lsb' is ignored for
+    BitArray).
+
+    Args:
+        'n_workers'     -   number of worker processes. By default - number of CPUs
+        'chunk_size'    -   size of chunk in bytes. By default data is split equally between workers
+    """
+    if isinstance(data, BitArray):
+        # BitArray bytes are in serial order already: 'lsb' is ignored as Crc.update() does
+        data, tail, n_tail = data.split_tail()
+        crc = Crc(polynomial, calc_parallel_crc(data, polynomial, crc_init, False, n_slices, n_workers, chunk_size),
+                  n_slices=n_slices)
+        crc.update(BitArray([tail << (8 - n_tail)], n_tail))
+        return crc.crc
+    n_workers = n_workers or os.cpu_count()
+    chunk_size = chunk_size or max(-(-len(data) // n_workers), 1)
+    if n_workers == 1 or len(data) <= chunk_size:
+        return _calc_chunk_crc(data, polynomial, crc_init, lsb, n_slices)
+    chunks = []
+    for idx in range(0, len(data), chunk_size):
+        foo = bytes(data[idx:idx + chunk_size])
+        chunks.append((len(foo), (_calc_chunk_crc, foo, polynomial, 0, lsb, n_slices)))
+    return _calc_chunks_crc(chunks, polynomial, crc_init, n_workers)
+
+
+def calc_file_crc(path2file, polynomial, crc_init=0, lsb=False, n_slices=16, n_workers=1, chunk_size=None):
+    """
+    Calculate N-bit CRC of file content (8-bit words) using mmap, i.e. without loading file to memory.
+    When 'n_workers' != 1 file is split into chunks processed in parallel (see calc_parallel_crc())
+    Return:
+        N-bit CRC value or None if there is no such file
+    """
+    if not osp.isfile(path2file):
+        return None
+    size = osp.getsize(path2file)
+    n_workers = n_workers or os.cpu_count()
+    chunk_size = chunk_size or max(-(-size // n_workers), 1)
+    if n_workers == 1 or size <= chunk_size:
+        return _calc_file_chunk_crc(path2file, 0, size, polynomial, crc_init, lsb, n_slices)
+    chunks = []
+    for offset in range(0, size, chunk_size):
+        length = min(chunk_size, size - offset)
+        chunks.append((length, (_calc_file_chunk_crc, path2file, offset, length, polynomial, 0, lsb, n_slices)))
+    return _calc_chunks_crc(chunks, polynomial, crc_init, n_workers)
+
+
 if __name__ == "__main__":
     poly_0x149F = 0x149F
     poly_0x120D = 0x120D
@@ -325,13 +825,12 @@ if __name__ == "__main__":
     data_arr = [0x7F, 0xD1, 0x00, 0x09, 0xB5, 0x88]
     # data_arr = [0x11] * 3
 
-    data_bitstring = conv_wordlist_2_bitstring(data_arr, 8, 0)
-    # log.debug(data_bitstring)
+    data_bits = BitArray.from_words(data_arr, 8)
 
-    foo = calc_crc(data_bitstring, poly, 0xFFF)
+    foo = calc_crc(data_bits, poly, 0xFFF)
     log.debug(f'0x{foo:03x}')
 
-    foo = conv_wordlist_2_bitstring(data_bitstring, 12, 1)
+    foo = data_bits.to_words(12).tolist()
     # log.debug([f'0x{item:03x}' for item in foo])
     foo = crc_12_0x149F(foo, 0xFFF)
     log.debug(f'0x{foo:03x}')
@@ -339,3 +838,9 @@ if __name__ == "__main__":
     crc_scheme = generate_vector_crc(poly, 8, lsb=False)
     foo = calc_vector_crc(data_arr, 8, crc_scheme, 0xFFF)
     log.debug(f'0x{foo:03x}')
+
+    foo = calc_table_crc(data_arr, poly, 0xFFF)
+    log.debug(f'0x{foo:03x}')
+
+    foo = calc_batch_crc([data_arr], 8, crc_scheme, 0xFFF)
+    log.debug(f'0x{int(foo[0]):03x}')
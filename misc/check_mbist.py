@@ -1,57 +1,394 @@
-# import os
-# import os.path as osp
+import os.path as osp
 import re
 import time
 import sys
+import queue
+import asyncio
+import json
+import hashlib
+import threading
+from collections import deque
 sys.path.append('/home/anton/.config/sublime-text/Packages/Todo/scrpt')
 
 import util
 import log_util
+import path
 from file import load
 
 log = log_util.get_logger(__name__, 'check_mbist.log')
 log.setLevel("INFO")
 
-cfg = load('check_mbist.json', 'json')
+"""
+MBIST regression: run simulation with different seeds, collect seeds of failed tests.
+check_mbist.json fields:
+    'run_cmd'                   - simulation command template: run_cmd % (sim_dir, seed, ' '.join(src_list))
+    'sim_dir', 'src_list'       - see 'run_cmd'
+    'n_tests', 'seed'           - number of tests with time based seeds or explicit list of seeds
+    'test_finished_marker'      - re pattern of simulator output line reporting test finish
+    'test_mismatch_marker'      - re pattern which marks finish line of failed test
+    'num_fault_max'             - stop regression when number of failed tests exceeds it
+    'jobs'                      - number of simulations run concurrently (default: 1). When more than one simulation
+                                  is run at once, every simulation is run in its own folder: <sim_dir>/run_<seed>
+    'hosts'                     - list of hosts to distribute seeds across instead of local 'jobs' slots:
+                                  [{'host': .., 'user': .., 'password': .., 'jobs': N}, ...] - remote host (see rmt),
+                                  {'backend': 'local', 'jobs': N} - local machine. 'sim_dir' should exist on every host
+    'timeout'                   - kill simulation running longer than this, seconds (default: no limit)
+    'idle_timeout'              - kill simulation which prints nothing for this time, seconds (default: no limit)
+    'log_tail'                  - number of the last simulation output lines kept for report (default: 300)
+    'results_file'              - JSON Lines file to store results of every test (default: check_mbist_results.jsonl).
+                                  Tests which are already there (the same seed, 'src_list' and 'run_cmd') aren't rerun,
+                                  time based seeds of unfinished regression are reused: interrupted regression resumes
+    'reuse_verdicts'            - stored test verdicts which aren't rerun (default: ['pass', 'fail']). Tests with other
+                                  verdicts ('timeout', 'idle_timeout', 'no_marker' - possibly infrastructure failure)
+                                  are rerun
+"""
 
-seed = round(time.time())
-log.info(f"Time seed: {seed}")
-seed = seed % 10000000
-fault_seeds = []
-print_log = 0
-run_cmd_tmpl = cfg['run_cmd']
-n_tests = cfg['n_tests'] if len(cfg['seed']) == 0 else len(cfg['seed'])
-log.info(f'Num of tests to be executed: {n_tests}')
 
-for idx in range(n_tests):
-    seed = cfg['seed'][idx] if len(cfg['seed']) > 0 else seed + 1
+class ResultStore(object):
+    """Class "ResultStore" - JSON Lines file with test results, keyed by inputs hash and seed"""
+
+    def __init__(self, path2file):
+        self.path2file = path2file
+        self.tests = {}  # (inputs, seed): record
+        self.regressions = {}  # inputs: the last regression record
+        if osp.isfile(path2file):
+            with open(path2file, 'r') as fid:
+                for line in fid:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # line truncated by crash
+                    if record.get('type') == 'test':
+                        self.tests[(record['inputs'], record['seed'])] = record
+                    elif record.get('type') == 'regression':
+                        self.regressions[record['inputs']] = record
+            log.info(f'Results loaded: {path2file}, {len(self.tests)} tests')
+
+    def add(self, record):
+        with open(self.path2file, 'a') as fid:
+            fid.write(json.dumps(record) + '\n')
+        if record['type'] == 'test':
+            self.tests[(record['inputs'], record['seed'])] = record
+        else:
+            self.regressions[record['inputs']] = record
+
+    def get(self, inputs, seed):
+        return self.tests.get((inputs, seed))
+
+
+def get_inputs_hash(cfg):
+    """Hash of test inputs: results of tests with the same seed and inputs hash are the same"""
+    foo = json.dumps({'run_cmd': cfg['run_cmd'], 'src_list': cfg['src_list']}, sort_keys=True)
+    return hashlib.sha1(foo.encode('utf-8')).hexdigest()[:16]
+
+
+class LocalHost(object):
+    """Class "LocalHost" - run simulations on local machine (see util.run_cmd_async())"""
+
+    def __init__(self, jobs=1):
+        self.name = 'local'
+        self.jobs = jobs  # number of simulations run at once
+
+    def mkdir(self, path2dir):
+        path.mkdir(path2dir)
+
+    def start(self, cmd, cwd, lines):
+        """
+        Start command, put its output lines to 'lines' queue as they arrive (None at the end).
+        Return: function which stops command and releases its resources
+        """
+        loop = asyncio.new_event_loop()
+        cancel = asyncio.Event()
+
+        async def run():
+            try:
+                await util.run_cmd_async(cmd, cwd=cwd, tail=0, line_handler=lines.put, cancel=cancel)
+            finally:
+                lines.put(None)
+        runner = threading.Thread(target=loop.run_until_complete, args=(run(),), daemon=True)
+        runner.start()
+
+        def stop():
+            loop.call_soon_threadsafe(cancel.set)
+            runner.join()
+            loop.close()
+        return stop
+
+
+class LineStream(object):
+    """Class "LineStream" - file-like object splitting text written to it into lines put to queue"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buf = ''
+
+    def write(self, text):
+        foo = (self.buf + text.replace('\r', '')).split('\n')
+        self.buf = foo.pop()
+        for line in foo:
+            self.lines.put(line)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buf:
+            self.lines.put(self.buf)
+            self.buf = ''
+
+
+class RemoteHost(object):
+    """Class "RemoteHost" - run simulations on remote host using one persistent fabric connection (see rmt.connect())"""
+
+    def __init__(self, host_cfg):
+        self.name = host_cfg['host']
+        self.jobs = host_cfg.get('jobs', 1)
+        import rmt  # fabric is needed for remote hosts only
+        self.conn = rmt.connect(host_cfg)
+
+    def mkdir(self, path2dir):
+        self.conn.run(f'mkdir -p {path2dir}', hide=True)
+
+    def start(self, cmd, cwd, lines):
+        """The same as LocalHost.start(). Closing remote pty on stop terminates remote command"""
+        stream = LineStream(lines)
+        promise = self.conn.run(
+            f'cd {cwd} && {cmd}', asynchronous=True, hide=True, warn=True, pty=True, out_stream=stream)
+
+        def wait_exit():
+            try:
+                promise.join()
+            except Exception as e:
+                log.debug(f'{self.name}: {e}')
+            stream.close()
+            lines.put(None)
+        waiter = threading.Thread(target=wait_exit, daemon=True)
+        waiter.start()
+
+        def stop():
+            if waiter.is_alive():
+                promise.runner.kill()
+            waiter.join(5)
+        return stop
+
+    def close(self):
+        self.conn.close()
+
+
+def get_hosts(cfg):
+    """Create hosts to run simulations on: cfg['hosts'] or local machine with cfg['jobs'] slots"""
+    hosts = []
+    for item in cfg.get('hosts', []):
+        hosts.append(LocalHost(item.get('jobs', 1)) if item.get('backend') == 'local' else RemoteHost(item))
+    return hosts or [LocalHost(cfg.get('jobs', 1))]
+
+
+def run_test(cfg, idx, seed, host=None, separate_dir=None, active=None, stop_event=None):
+    """
+    Run single simulation. Simulator output is scanned line by line while running,
+    simulation is stopped as soon as test finish marker is found or timeout expires.
+    active - set to register simulation stop function in while it's running (to stop it from other thread).
+        Simulation stopped this way has 'stopped' verdict
+    stop_event - threading.Event: regression is stopped (set before 'active' stop functions are called)
+    Return: dict with test results
+    """
     tme = time.time()
+    host = host or LocalHost()
+    separate_dir = cfg.get('jobs', 1) > 1 if separate_dir is None else separate_dir
+    run_dir = cfg['sim_dir']
+    if separate_dir:
+        run_dir = osp.join(cfg['sim_dir'], 'run_%d' % seed)
+        host.mkdir(run_dir)
+
+    run_cmd = cfg['run_cmd'] % (run_dir, seed, ' '.join(cfg['src_list']))
+    log.debug(f'{host.name}: {run_cmd}')
+    result = {'idx': idx, 'seed': seed, 'host': host.name, 'finish_line': None, 'fault': True, 'timeout': None}
+    tail = deque(maxlen=cfg.get('log_tail', 300))
+    finished_marker = re.compile(cfg['test_finished_marker'])
+    mismatch_marker = re.compile(cfg['test_mismatch_marker'])
+
+    lines = queue.Queue()
+    stop_host = host.start(run_cmd, run_dir, lines)
+    stop_lock = threading.Lock()
+    stopped = []
+
+    def stop(external=False):
+        with stop_lock:
+            if not stopped:
+                stopped.append(True)
+                result['stopped'] = external
+                stop_host()
+
+    def stop_ext():
+        # called by regression from other thread: early stop or interrupt
+        stop(True)
+    if active is not None:
+        active.add(stop_ext)
+        if stop_event is not None and stop_event.is_set():  # regression was stopped while simulation was starting
+            stop_ext()
+    try:
+        while True:
+            wait_time = [cfg['idle_timeout']] if cfg.get('idle_timeout') else []
+            if cfg.get('timeout'):
+                wait_time.append(cfg['timeout'] - (time.time() - tme))
+            try:
+                line = lines.get(timeout=max(min(wait_time), 0) if wait_time else None)
+            except queue.Empty:
+                result['timeout'] = 'timeout' if cfg.get('timeout') and time.time() - tme >= cfg['timeout'] else 'idle_timeout'
+                break
+            if line is None:  # simulation exited
+                break
+            tail.append(line)
+            if finished_marker.search(line):
+                result['finish_line'] = line
+                result['fault'] = mismatch_marker.search(line) is not None
+                break
+    finally:
+        if active is not None:
+            active.discard(stop_ext)
+        stop()
+
+    if result['finish_line'] is not None:
+        result['verdict'] = 'fail' if result['fault'] else 'pass'
+    elif result.pop('stopped', False):
+        result['verdict'] = 'stopped'
+    else:
+        result['verdict'] = result['timeout'] or 'no_marker'
+    result['stdout'] = '\n'.join(tail)
+    result['dur'] = time.time() - tme
+    return result
+
 
-    run_cmd = run_cmd_tmpl % (cfg['sim_dir'], seed, ' '.join(cfg['src_list']))
-    foo = util.subprocess_call(run_cmd)
-
-    stdout = foo.stdout.split('\n')
-    for line in stdout:
-        if re.search(cfg['test_finished_marker'], line):
-            log.info(f"""Test: {idx}  Faults detected: {len(fault_seeds)}  Seed: {seed}  Dur: {round(time.time() - tme):2}s {line}""")
-            if re.search(cfg['test_mismatch_marker'], line):
-                log.info(foo.stdout)
-                fault_seeds.append(seed)
-            break
+def run_regression(cfg, seeds, store=None, hosts=None, print_log=0):
+    """
+    Run simulations for all seeds. Seeds are taken from shared queue by 'jobs' workers of every host.
+    Seeds which final results (see 'reuse_verdicts') are in 'store' already aren't rerun. Return: list of fault seeds
+    """
+    fault_seeds = []
+    inputs = get_inputs_hash(cfg)
+    hosts = hosts or get_hosts(cfg)
+    separate_dir = sum(host.jobs for host in hosts) > 1
+    todo = queue.Queue()
+    results = queue.Queue()
+    stop = threading.Event()
+    active = set()  # stop functions of running simulations
+
+    def handle_result(res):
+        """Report test result. Return: True if regression should be stopped"""
+        if res['verdict'] != 'pass':
+            fault_seeds.append(res['seed'])
+        info = f"Test: {res['idx']}  Faults detected: {len(fault_seeds)}  Seed: {res['seed']}  Dur: {round(res['dur']):2}s"
+        if res['verdict'] in ('pass', 'fail'):
+            log.info(f"{info} {res['finish_line']}")
+        elif res['verdict'] in ('timeout', 'idle_timeout'):
+            # test hangs: it was killed, regression goes on
+            log.info(f"{info} Killed by {res['verdict']}")
+        else:
+            # Can't find test stop marker: something went wrong (elaboration fail, crash, ...)
+            log.info(f"Can't find test stop marker: something went wrong. Seed: {res['seed']}")
+        if res['verdict'] != 'pass' or print_log == 1:
+            log.info(res['stdout'])
+        return res['verdict'] == 'no_marker' or len(fault_seeds) > cfg['num_fault_max']
+
+    def worker(host):
+        """Take seeds from shared queue and run them on 'host' until queue is empty or regression is stopped"""
+        try:
+            while not stop.is_set():
+                try:
+                    idx, seed = todo.get_nowait()
+                except queue.Empty:
+                    break
+                if stop.is_set():  # regression was stopped while the seed was taken
+                    break
+                try:
+                    results.put(run_test(cfg, idx, seed, host, separate_dir, active, stop))
+                except Exception as e:
+                    log.error(f'{host.name}: seed {seed} failed to run: {e}. Host is excluded')
+                    todo.put((idx, seed))  # to be run by other hosts
+                    break
+        finally:
+            results.put(None)
+
+    reuse_verdicts = cfg.get('reuse_verdicts', ['pass', 'fail'])
+    for idx, seed in enumerate(seeds):
+        record = store.get(inputs, seed) if store is not None else None
+        if record is not None and record['verdict'] not in reuse_verdicts:
+            log.info(f"Test: {idx}  Seed: {seed}  Stored result is rerun: {record['verdict']}")
+            record = None
+        if record is None:
+            todo.put((idx, seed))
+        elif not stop.is_set():
+            log.info(f"Test: {idx}  Seed: {seed}  Result is stored already: {record['verdict']}")
+            if handle_result(dict(record, idx=idx, stdout=record['tail'])):
+                stop.set()
+
+    workers = [threading.Thread(target=worker, args=(host,), daemon=True) for host in hosts for i in range(host.jobs)]
+    for item in workers:
+        item.start()
+    n_running = len(workers)
+
+    def stop_regression():
+        stop.set()
+        for item in list(active):
+            item()
+
+    try:
+        while n_running > 0:
+            res = results.get()
+            if res is None:
+                n_running -= 1
+                continue
+            if res['verdict'] == 'stopped':  # killed by early stop: neither result nor fault
+                log.info(f"Test: {res['idx']}  Seed: {res['seed']}  Stopped")
+                continue
+            if store is not None:
+                store.add({
+                    'type': 'test', 'inputs': inputs, 'seed': res['seed'], 'verdict': res['verdict'],
+                    'dur': res['dur'], 'finish_line': res['finish_line'], 'tail': res['stdout'],
+                    'host': res['host'], 'time': util.get_time()['dt']})
+            if handle_result(res) and not stop.is_set():
+                # simulations may last for hours: don't wait for running ones
+                stop_regression()
+    except BaseException:
+        # Ctrl-C etc.: simulators run in their own sessions, so kill them explicitly
+        log.error('Regression interrupted: stopping running simulations ...')
+        stop_regression()
+        for item in workers:
+            item.join()
+        raise
+    if not stop.is_set() and not todo.empty():
+        log.error(f'{todo.qsize()} seeds were not run: no hosts left')
+    return fault_seeds
+
+
+if __name__ == "__main__":
+    cfg = load('check_mbist.json', 'json')
+
+    store = ResultStore(cfg.get('results_file', 'check_mbist_results.jsonl'))
+    inputs = get_inputs_hash(cfg)
+
+    seed = round(time.time())
+    log.info(f"Time seed: {seed}")
+    seed = seed % 10000000
+    n_tests = cfg['n_tests'] if len(cfg['seed']) == 0 else len(cfg['seed'])
+    seeds = cfg['seed'] if len(cfg['seed']) > 0 else [seed + idx + 1 for idx in range(n_tests)]
+    prev = store.regressions.get(inputs)
+    if len(cfg['seed']) == 0 and prev is not None and len(prev['seeds']) == n_tests and not prev['finished']:
+        seeds = prev['seeds']
+        log.info(f"Resume unfinished regression started at {prev['time']}")
     else:
-        # Can't find test stop marker: something went wrong (elaboration fail, test hangs, ...)
-        log.info("Can't find test stop marker: something went wrong")
-        log.info(foo.stdout)
-        fault_seeds.append(seed)
-        break
-
-    if print_log == 1:
-        stdout = '\n'.join(foo.stdout.split('\n')[0:300])
-        log.info(stdout)
-
-    if len(fault_seeds) > cfg['num_fault_max']:
-        break
-
-log.info(f'Finished. Tests run: {n_tests}. Faults detected: {len(fault_seeds)}')
-if len(fault_seeds) > 0:
-    log.error(f'Fault seeds: {fault_seeds}')
+        store.add({'type': 'regression', 'inputs': inputs, 'seeds': seeds, 'finished': False, 'time': util.get_time()['dt']})
+    hosts = get_hosts(cfg)
+    log.info(f"Num of tests to be executed: {n_tests}. Hosts: {', '.join(f'{host.name}({host.jobs})' for host in hosts)}")
+
+    try:
+        fault_seeds = run_regression(cfg, seeds, store, hosts)
+    finally:
+        for host in hosts:
+            if isinstance(host, RemoteHost):
+                host.close()
+    store.add(dict(store.regressions[inputs], finished=True))
+
+    log.info(f'Finished. Tests run: {n_tests}. Faults detected: {len(fault_seeds)}')
+    if len(fault_seeds) > 0:
+        log.error(f'Fault seeds: {fault_seeds}')
@@ -0,0 +1,139 @@
+"""CRC engines benchmark & cross-validation: run every engine on the same random data, compare results, store timing to json"""
+import os.path as osp
+import sys
+import time
+import random
+
+sys.path.append(osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+import args
+import util
+import log_util
+from file import load, save
+from calculate_crc import (
+    BitArray, calc_crc, generate_vector_crc, generate_vector_crc_masks, calc_vector_crc, calc_batch_crc,
+    generate_crc_func, calc_table_crc, crc_12_0x149F, crc_12_0x120D)
+
+log = log_util.get_logger(__name__, level="INFO")
+
+polynomials = {
+    0x149F: crc_12_0x149F,
+    0x120D: crc_12_0x120D,
+    0x11021: None,  # CRC-16-CCITT
+    0x104C11DB7: None,  # CRC-32
+    0x142F0E1EBA9EA3693: None,  # CRC-64-ECMA
+}
+
+
+def timeit(func, *args, **kwargs):
+    """Return (func result, duration in seconds)"""
+    tme = time.perf_counter()
+    foo = func(*args, **kwargs)
+    return foo, time.perf_counter() - tme
+
+
+def run_case(polynomial, word_width, lsb, n_words, max_serial_bits):
+    """
+    Calculate CRC of n_words random word_width-bit values by every engine.
+    Return:
+        dict with case parameters, scheme generation time, per engine CRC/time/throughput and 'match' flag
+    """
+    words = [random.getrandbits(word_width) for i in range(n_words)]
+    n_crc = polynomial.bit_length() - 1
+    crc_init = random.getrandbits(n_crc)
+    n_bytes = n_words * word_width / 8
+
+    generate_vector_crc_masks.cache_clear()
+    crc_masks, scheme_time = timeit(generate_vector_crc_masks, polynomial, word_width, lsb)
+    crc_scheme = generate_vector_crc(polynomial, word_width, lsb)
+    generate_crc_func.cache_clear()
+    crc_func, func_time = timeit(generate_crc_func, polynomial, word_width, lsb)
+
+    engines = {
+        'calc_vector_crc': lambda: calc_vector_crc(words, word_width, crc_scheme, crc_init),
+        'calc_table_crc_bytewise': lambda: calc_table_crc(words, polynomial, crc_init, word_width, lsb, n_slices=1),
+        'calc_table_crc_slice16': lambda: calc_table_crc(words, polynomial, crc_init, word_width, lsb, n_slices=16),
+        'generate_crc_func': lambda: crc_func(words, crc_init),
+    }
+    if n_words * word_width <= max_serial_bits:
+        bitstr = BitArray.from_words(words, word_width, lsb).to_bitstring()
+        engines['calc_crc'] = lambda: calc_crc(bitstr, polynomial, crc_init)
+    if word_width <= 64:
+        engines['calc_batch_crc'] = lambda: int(calc_batch_crc([words], word_width, crc_scheme, crc_init)[0])
+    if polynomials.get(polynomial) and word_width == 12 and not lsb:
+        engines[polynomials[polynomial].__name__] = lambda: polynomials[polynomial](words, crc_init)
+
+    result = {
+        'polynomial': f'0x{polynomial:X}', 'word_width': word_width, 'lsb': lsb, 'n_words': n_words,
+        'crc_init': crc_init, 'scheme_time': scheme_time, 'crc_func_time': func_time, 'engines': {}}
+    for name, engine in engines.items():
+        crc, dur = timeit(engine)
+        result['engines'][name] = {'crc': crc, 'time': dur, 'mbps': n_bytes / dur / 1e6 if dur > 0 else None}
+    result['match'] = len({item['crc'] for item in result['engines'].values()}) == 1
+    return result
+
+
+def run(word_widths, n_words_list, seed, max_serial_bits):
+    random.seed(seed)
+    results = []
+    for polynomial in polynomials:
+        for word_width in word_widths:
+            for lsb in (False, True):
+                for n_words in n_words_list:
+                    foo = run_case(polynomial, word_width, lsb, n_words, max_serial_bits)
+                    results.append(foo)
+                    rate = ', '.join(f"{name}: {item['mbps']:.3f}" for name, item in foo['engines'].items() if item['mbps'])
+                    log.info(f"{foo['polynomial']} width={word_width} lsb={lsb} n_words={n_words} "
+                             f"scheme={foo['scheme_time'] * 1e3:.2f}ms MB/s: {rate}")
+                    if not foo['match']:
+                        log.error(f"Engines disagree: { {name: hex(item['crc']) for name, item in foo['engines'].items()} }")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare throughput with baseline results (previous run json).
+    Return:
+        list of (case, engine, baseline MB/s, current MB/s) which became slower by more than 'tolerance' fraction
+    """
+    def case_key(item):
+        return (item['polynomial'], item['word_width'], item['lsb'], item['n_words'])
+
+    prev = {case_key(item): item for item in baseline['results']}
+    regressions = []
+    for item in results:
+        foo = prev.get(case_key(item))
+        if foo is None:
+            continue
+        for name, engine in item['engines'].items():
+            mbps = foo['engines'].get(name, {}).get('mbps')
+            if mbps and engine['mbps'] and engine['mbps'] < mbps * (1 - tolerance):
+                regressions.append((case_key(item), name, mbps, engine['mbps']))
+    return regressions
+
+
+if __name__ == "__main__":
+    args.define_str('widths', default='8,12,16,32', help='comma-separated data word widths')
+    args.define_str('n_words', default='16,256,4096', help='comma-separated message sizes in words')
+    args.define_int('seed', default=1, help='random seed')
+    args.define_int('max_serial_bits', default=1 << 16, help='largest message (bits) to run bit-serial calc_crc on')
+    args.define_str('out', default='crc_bench.json', help='json results file')
+    args.define_str('baseline', default='', help='previous results json to compare throughput with')
+    args.define_int('tolerance', default=20, help='allowed throughput drop vs baseline, %%')
+    cfg = args.parse()
+
+    results = run(
+        [int(item) for item in cfg.widths.split(',')], [int(item) for item in cfg.n_words.split(',')],
+        cfg.seed, cfg.max_serial_bits)
+    n_fault = len([item for item in results if not item['match']])
+    save({'host': util.get_hostname(), 'python': sys.version, 'time': util.get_time()['dt'], 'seed': cfg.seed,
+          'n_fault': n_fault, 'results': results}, cfg.out, 'json', indent=2)
+    if cfg.baseline:
+        baseline = load(cfg.baseline, 'json')
+        if baseline is None:
+            log.error(f'Baseline results not found: {cfg.baseline}')
+        else:
+            for case, name, prev, curr in compare(results, baseline, cfg.tolerance / 100):
+                log.warning(f'Throughput regression: {case} {name}: {prev:.3f} -> {curr:.3f} MB/s')
+    log.info(f'Finished. Cases run: {len(results)}. Mismatches: {n_fault}. Results: {cfg.out}')
+    sys.exit(1 if n_fault else 0)
@@ -0,0 +1,143 @@
+"""CRC polynomials evaluation: minimum Hamming distance and undetected error weight distribution for given data length"""
+import os
+import os.path as osp
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+import args
+import log_util
+from file import save
+from calculate_crc import get_poly_width
+
+log = log_util.get_logger(__name__, level="INFO")
+
+
+def gen_candidate_polynomials(n_crc):
+    """Generate all (n_crc+1)-bit polynomials with the highest and the lowest degrees present"""
+    assert 0 < n_crc <= 64, "'n_crc' should be in range [1, 64]"
+    top = (1 << n_crc) | 1
+    return [top | (item << 1) for item in range(1 << (n_crc - 1))]
+
+
+def calc_syndromes(polynomials, n_data_bits):
+    """
+    Calculate syndromes of single bit errors for a batch of N-bit CRC polynomials (of the same N) at once.
+    Codeword is n_data_bits of data followed by N-bit CRC. Error pattern is undetected if xor of its syndromes is 0.
+    Return:
+        uint64 array [n_polynomials, N + n_data_bits]
+    """
+    n_crc = get_poly_width(polynomials[0])
+    assert all(get_poly_width(item) == n_crc for item in polynomials), "All 'polynomials' should be of the same size"
+    mask = np.uint64((1 << n_crc) - 1)
+    top = np.uint64(n_crc - 1)
+    one = np.uint64(1)
+    feedback = np.array([(item & int(mask)) | 1 for item in polynomials], dtype=np.uint64)
+
+    syndromes = np.empty((len(polynomials), n_crc + n_data_bits), dtype=np.uint64)
+    syndromes[:, :n_crc] = one << np.arange(n_crc, dtype=np.uint64)  # errors in CRC field
+    foo = feedback.copy()  # error in the last data bit
+    for i in range(n_data_bits):
+        syndromes[:, n_crc + i] = foo
+        foo = ((foo << one) & mask) ^ (feedback * ((foo >> top) & one))
+    return syndromes
+
+
+def calc_weight_distribution(syndromes, max_weight=4, odd_weights=True):
+    """
+    Count undetected error patterns of weight 2..max_weight (max_weight <= 4).
+    'syndromes'     - single bit error syndromes of codeword, see calc_syndromes()
+    'odd_weights'   - whether odd weight errors may be undetected (False for polynomials divisible by x + 1)
+    Return:
+        dict {weight: number of undetected error patterns}
+    """
+    assert 2 <= max_weight <= 4, "'max_weight' should be in range [2, 4]"
+    n_bits = len(syndromes)
+    values, counts = np.unique(syndromes, return_counts=True)
+    weights = {2: int((counts * (counts - 1) // 2).sum())}
+
+    if max_weight >= 3:
+        # every undetected triple {a, b, c} is counted once for each of its 3 pairs: s[a] ^ s[b] == s[c]
+        foo = 0
+        if odd_weights:
+            for a in range(n_bits - 1):
+                bar = syndromes[a] ^ syndromes[a + 1:]
+                idx = np.minimum(np.searchsorted(values, bar), len(values) - 1)
+                foo += int(counts[idx][values[idx] == bar].sum())
+        weights[3] = foo // 3
+
+    if max_weight >= 4:
+        # every undetected quad is counted once for each of its 3 splits into pairs with equal xor,
+        # pairs sharing a bit collide when the other two bits have equal syndromes
+        foo = np.concatenate([syndromes[a] ^ syndromes[a + 1:] for a in range(n_bits - 1)])
+        foo = np.unique(foo, return_counts=True)[1]
+        weights[4] = (int((foo * (foo - 1) // 2).sum()) - weights[2] * (n_bits - 2)) // 3
+    return weights
+
+
+def evaluate_polynomials(polynomials, n_data_bits, max_weight=4):
+    """
+    Evaluate batch of N-bit CRC polynomials (of the same N) for n_data_bits data length.
+    Return:
+        list of dict {'polynomial', 'n_crc', 'n_data_bits', 'hd', 'weights'}. 'hd' is None when HD > max_weight
+    """
+    results = []
+    for polynomial, syndromes in zip(polynomials, calc_syndromes(polynomials, n_data_bits)):
+        weights = calc_weight_distribution(syndromes, max_weight, bin(polynomial).count('1') % 2 == 1)
+        hd = min([w for w in weights if weights[w] > 0], default=None)
+        results.append({
+            'polynomial': f'0x{polynomial:X}', 'n_crc': get_poly_width(polynomial), 'n_data_bits': n_data_bits,
+            'hd': hd, 'weights': weights})
+    return results
+
+
+def rank_key(result, max_weight=4):
+    """Sort key: the largest HD first, then the least number of undetected errors of the lowest weights"""
+    hd = result['hd'] or max_weight + 1
+    return (-hd, [result['weights'][w] for w in sorted(result['weights'])])
+
+
+def search_polynomials(polynomials, n_data_bits, max_weight=4, n_workers=None, chunk_size=256):
+    """
+    Evaluate 'polynomials' in process pool. Polynomials are split into batches of 'chunk_size' of the same size.
+    Return:
+        list of evaluate_polynomials() results sorted from the best polynomial to the worst
+    """
+    groups = {}
+    for item in polynomials:
+        groups.setdefault(get_poly_width(item), []).append(item)
+    chunks = [group[idx:idx + chunk_size] for group in groups.values() for idx in range(0, len(group), chunk_size)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count()) as executor:
+        futures = [executor.submit(evaluate_polynomials, chunk, n_data_bits, max_weight) for chunk in chunks]
+        for idx, future in enumerate(futures):
+            results += future.result()
+            log.debug(f'Evaluated {idx + 1}/{len(chunks)} batches')
+    return sorted(results, key=lambda item: rank_key(item, max_weight))
+
+
+if __name__ == "__main__":
+    args.define_int('n_data_bits', default=48, help='data length in bits')
+    args.define_str('n_crc', default='12', help='comma-separated CRC sizes: all polynomials of these sizes are evaluated')
+    args.define_str('polynomials', default='', help='comma-separated polynomials to evaluate instead of all ones')
+    args.define_int('max_weight', default=4, help='the largest error weight to count (<= 4)')
+    args.define_int('n_workers', default=0, help='number of worker processes. 0 - number of CPUs')
+    args.define_int('top', default=20, help='number of the best polynomials to log')
+    args.define_str('out', default='', help='json file to store all results')
+    cfg = args.parse()
+
+    if cfg.polynomials:
+        candidates = [int(item, 0) for item in cfg.polynomials.split(',')]
+    else:
+        candidates = [poly for n_crc in cfg.n_crc.split(',') for poly in gen_candidate_polynomials(int(n_crc))]
+    log.info(f'Polynomials to be evaluated: {len(candidates)}, data length: {cfg.n_data_bits} bits')
+
+    results = search_polynomials(candidates, cfg.n_data_bits, cfg.max_weight, cfg.n_workers or None)
+    for item in results[:cfg.top]:
+        log.info(f"{item['polynomial']}  HD: {item['hd'] or '> %d' % cfg.max_weight}  Undetected errors: {item['weights']}")
+    if cfg.out:
+        save(results, cfg.out, 'json', indent=2)
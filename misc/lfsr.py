@@ -0,0 +1,126 @@
+"""LFSR/PRBS pattern generator. Uses the same LFSR and polynomial convention as calculate_crc.calc_crc()"""
+import copy
+from functools import reduce
+from operator import xor, getitem
+
+import numpy as np
+
+from log_util import get_logger
+from calculate_crc import BitArray, get_poly_width, gen_crc_zeros_matrix, gf2_mat_vec
+
+log = get_logger(__name__, level="INFO")
+
+# maximal length polynomials: x^7 + x^6 + 1, x^15 + x^14 + 1, x^23 + x^18 + 1, x^31 + x^28 + 1
+prbs_polynomials = {
+    'prbs7': 0xC1,
+    'prbs15': 0xC001,
+    'prbs23': 0x840001,
+    'prbs31': 0x90000001,
+}
+
+
+class Lfsr(object):
+    """
+    Class "Lfsr" - bulk LFSR output sequence generator.
+    The LFSR is calc_crc() one applied with zero data: output bit of every shift is the high LFSR bit (feedback).
+    """
+
+    def __init__(self, polynomial, state=1, n_step_bits=512):
+        """
+        polynomial -- (N+1)-bit polynomial representation (highest and lowest degrees are present). N <= 64
+        state -- N-bit init value of LFSR
+        n_step_bits -- number of output bits generated per lookup step. Should be multiple of 8
+        """
+        assert n_step_bits > 0 and n_step_bits % 8 == 0, "'n_step_bits' should be a positive multiple of 8"
+        self.polynomial = prbs_polynomials.get(polynomial, polynomial)
+        self.n_lfsr = get_poly_width(self.polynomial)
+        self.mask = (1 << self.n_lfsr) - 1
+        self.feedback = (self.polynomial & self.mask) | 1
+        assert 0 <= state <= self.mask, "Too large 'state' magnitude detected!"
+        self.state = state
+        self.n_step_bits = n_step_bits
+        self.tables = self.generate_tables()
+
+    def step(self, state):
+        """Single LFSR shift. Return: (output bit, new state)"""
+        foo = state >> (self.n_lfsr - 1)
+        return foo, ((state << 1) & self.mask) ^ (self.feedback if foo else 0)
+
+    def generate_tables(self):
+        """
+        Generate lookup tables: tables[j][b] - (output << N) | state after n_step_bits shifts
+        starting from state (b << 8 * j). Output and state are linear over GF(2), so the tables are built from basis.
+        """
+        basis = []
+        for i in range(self.n_lfsr):
+            state = 1 << i
+            out = 0
+            for k in range(self.n_step_bits):
+                foo, state = self.step(state)
+                out = (out << 1) | foo
+            basis.append((out << self.n_lfsr) | state)
+
+        tables = []
+        for j in range(0, self.n_lfsr, 8):
+            table = [0] * 256
+            for b in range(1, 256):
+                low = b & -b
+                idx = j + low.bit_length() - 1
+                table[b] = table[b ^ low] ^ (basis[idx] if idx < self.n_lfsr else 0)
+            tables.append(tuple(table))
+        return tuple(tables)
+
+    def generate(self, n_bits):
+        """
+        Generate next 'n_bits' bits of LFSR output sequence.
+        Return:
+            BitArray. Use BitArray.to_words() to get packed words
+        """
+        n_steps, n_rem = divmod(n_bits, self.n_step_bits)
+        n_bytes = (self.n_lfsr + 7) // 8
+        n_out_bytes = self.n_step_bits // 8
+        state = self.state
+        foo = bytearray()
+        for i in range(n_steps):
+            bar = reduce(xor, map(getitem, self.tables, state.to_bytes(n_bytes, 'little')))
+            state = bar & self.mask
+            foo += (bar >> self.n_lfsr).to_bytes(n_out_bytes, 'big')
+
+        out = 0
+        for i in range(n_rem):
+            bar, state = self.step(state)
+            out = (out << 1) | bar
+        n_pad = -n_rem % 8
+        foo += (out << n_pad).to_bytes((n_rem + n_pad) // 8, 'big')
+        self.state = state
+        return BitArray(foo, n_bits)
+
+    def generate_words(self, n_words, word_width=32, lsb=False):
+        """Generate next 'n_words' word_width-bit words of LFSR output sequence. Return: uint64 array"""
+        return self.generate(n_words * word_width).to_words(word_width, lsb)
+
+    def generate_bits(self, n_bits):
+        """Generate next 'n_bits' bits of LFSR output sequence. Return: uint8 array of 0/1 values"""
+        foo = self.generate(n_bits)
+        return np.unpackbits(np.frombuffer(foo.data, dtype=np.uint8), count=n_bits)
+
+    def jump(self, n_steps):
+        """Jump ahead by 'n_steps' LFSR shifts using GF(2) matrix power"""
+        self.state = gf2_mat_vec(gen_crc_zeros_matrix(self.polynomial, n_steps), self.state)
+        return self.state
+
+    def copy(self):
+        return copy.copy(self)
+
+
+def get_lfsr_streams(polynomial, n_streams, stride, state=1, n_step_bits=512):
+    """
+    Create 'n_streams' LFSR generators started at offsets 0, stride, 2 * stride, ... of the same sequence.
+    Used to generate parts of a long pattern in parallel.
+    """
+    lfsr = Lfsr(polynomial, state, n_step_bits)
+    streams = []
+    for i in range(n_streams):
+        streams.append(lfsr.copy())
+        lfsr.jump(stride)
+    return streams
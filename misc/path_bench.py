@@ -0,0 +1,199 @@
+"""path/file operations benchmark: generate synthetic folder trees and logs, time every operation, measure its peak
+Python memory, store results to json and compare them with previous run"""
+import os
+import os.path as osp
+import sys
+import time
+import random
+import shutil
+import tempfile
+import tracemalloc
+
+sys.path.append(osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+import args
+import util
+import log_util
+import path
+import file
+from file import load, save
+
+log = log_util.get_logger(__name__, level="INFO")
+
+
+def gen_tree(root, n_files, files_per_dir=100, file_size=256):
+    """Generate folder tree of n_files files: 'files_per_dir' files per folder, two levels of folders"""
+    n_dirs = (n_files + files_per_dir - 1) // files_per_dir
+    fanout = max(int(n_dirs ** 0.5), 1)
+    data = b'x' * file_size
+    for i in range(n_files):
+        k = i // files_per_dir
+        foo = osp.join(root, f'd{k // fanout}', f'd{k % fanout}')
+        if i % files_per_dir == 0:
+            os.makedirs(foo, exist_ok=True)
+        with open(osp.join(foo, f'f{i}.log' if i % 10 == 0 else f'f{i}.txt'), 'wb') as fid:
+            fid.write(data)
+
+
+def gen_log(path2file, n_mb, seed=1):
+    """Generate simulation-like text log of n_mb MB. About 1% of lines are errors"""
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(4096):
+        if rnd.random() < 0.01:
+            lines.append(f'ERROR : mismatch at addr=0x{rnd.getrandbits(32):08x} exp=0x{rnd.getrandbits(32):08x}\n')
+        else:
+            lines.append(f'INFO : t={rnd.getrandbits(40)}ps seed={rnd.getrandbits(31)} data=0x{rnd.getrandbits(64):016x}\n')
+    chunk = ''.join(lines).encode()
+    n_bytes = n_mb << 20
+    with open(path2file, 'wb') as fid:
+        while n_bytes > 0:
+            fid.write(chunk[:n_bytes])
+            n_bytes -= len(chunk)
+
+
+def measure(func, setup=None, repeat=3):
+    """
+    Run func() 'repeat' times for timing and once more under tracemalloc for peak memory.
+    setup -- function called before every func() run (not timed)
+    Return:
+        dict {'time': best time, s, 'times': all times, 'peak_mem': peak Python memory, bytes}
+    """
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        tme = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - tme)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    func()
+    peak_mem = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'time': min(times), 'times': times, 'peak_mem': peak_mem}
+
+
+def run_tree_cases(work_dir, n_files, repeat):
+    """Time path operations on n_files tree"""
+    tree = osp.join(work_dir, f'tree_{n_files}')
+    dst = osp.join(work_dir, f'copy_{n_files}')
+    tme = time.perf_counter()
+    gen_tree(tree, n_files)
+    log.info(f'Tree of {n_files} files generated in {time.perf_counter() - tme:.1f}s')
+
+    def clean_dst():
+        if osp.exists(dst):
+            path.remove_tree(dst)
+
+    def make_dst():
+        if not osp.exists(dst):
+            path.copy_tree(tree, dst, path.CopyStats(0))
+
+    cases = {
+        'path.get_dir_content': (lambda: path.get_dir_content(tree), None),
+        'path.find_patt': (lambda: path.find_patt(tree, r'\.log$'), None),
+        'path.find_patt_glob': (lambda: path.find_patt(tree, '*.log', glob=True, basename=True), None),
+        'path.get_disk_usage': (lambda: (path.du_cache.clear(), path.get_disk_usage(tree)), None),
+        'path.hash_tree': (lambda: path.hash_tree(tree), None),
+        'path.copy': (lambda: path.copy(tree, dst, progress_interval=0), clean_dst),
+        'path.copy_incremental': (lambda: path.copy(tree, dst, incremental=True, progress_interval=0), make_dst),
+        'path.remove': (lambda: path.remove(dst), make_dst),
+    }
+    results = []
+    for name, (func, setup) in cases.items():
+        foo = measure(func, setup, repeat)
+        foo.update({'op': name, 'n_files': n_files, 'files_per_s': n_files / foo['time'] if foo['time'] else None})
+        results.append(foo)
+        log.info(f"{name} n_files={n_files}: {foo['time'] * 1e3:.1f}ms, {foo['files_per_s']:.0f} files/s, "
+                 f"peak mem {foo['peak_mem'] / 1e6:.1f} MB")
+    path.remove_tree(tree)
+    clean_dst()
+    return results
+
+
+def run_log_cases(work_dir, n_mb, repeat):
+    """Time file operations on n_mb MB log"""
+    path2log = osp.join(work_dir, f'log_{n_mb}.txt')
+    path2tmp = osp.join(work_dir, f'log_{n_mb}_tmp.txt')
+    gen_log(path2log, n_mb)
+
+    cases = {
+        'file.load': (lambda: load(path2log, 'txt'), None),
+        'file.find_patt': (lambda: file.find_patt(path2log, [r'ERROR', r'addr=0x0']), None),
+        'file.remove_patt': (lambda: file.remove_patt(path2tmp, r'^INFO'), lambda: shutil.copyfile(path2log, path2tmp)),
+    }
+    results = []
+    for name, (func, setup) in cases.items():
+        foo = measure(func, setup, repeat)
+        foo.update({'op': name, 'log_mb': n_mb, 'mbps': n_mb * 1.048576 / foo['time'] if foo['time'] else None})
+        results.append(foo)
+        log.info(f"{name} log={n_mb}MB: {foo['time'] * 1e3:.1f}ms, {foo['mbps']:.1f} MB/s, "
+                 f"peak mem {foo['peak_mem'] / 1e6:.1f} MB")
+    os.remove(path2log)
+    if osp.exists(path2tmp):
+        os.remove(path2tmp)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare with baseline results (previous run json).
+    Return:
+        list of (case, metric, baseline value, current value) which became worse by more than 'tolerance' fraction
+    """
+    def case_key(item):
+        return (item['op'], item.get('n_files'), item.get('log_mb'))
+
+    prev = {case_key(item): item for item in baseline['results']}
+    regressions = []
+    for item in results:
+        foo = prev.get(case_key(item))
+        if foo is None:
+            continue
+        for metric in ('time', 'peak_mem'):
+            if foo.get(metric) and item[metric] > foo[metric] * (1 + tolerance):
+                regressions.append((case_key(item), metric, foo[metric], item[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    args.define_str('n_files', default='1000,10000', help='comma-separated tree sizes in files (up to 1M)')
+    args.define_str('log_mb', default='1,16', help='comma-separated log sizes in MB (up to 10240)')
+    args.define_int('repeat', default=3, help='number of timed runs of every operation: the best time is stored')
+    args.define_int('max_load_mb', default=2048, help='skip file.* operations (they load whole log) on larger logs')
+    args.define_str('work_dir', default='', help='folder for generated data (default: temporary folder)')
+    args.define_str('out', default='path_bench.json', help='json results file')
+    args.define_str('baseline', default='', help='previous results json to compare with')
+    args.define_int('tolerance', default=20, help='allowed time/memory increase vs baseline, %%')
+    cfg = args.parse()
+
+    work_dir = cfg.work_dir or tempfile.mkdtemp(prefix='path_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    try:
+        for n_files in [int(item) for item in cfg.n_files.split(',') if item]:
+            results += run_tree_cases(work_dir, n_files, cfg.repeat)
+        for n_mb in [int(item) for item in cfg.log_mb.split(',') if item]:
+            if n_mb > cfg.max_load_mb:
+                log.warning(f'Log of {n_mb}MB skipped: larger than max_load_mb')
+                continue
+            results += run_log_cases(work_dir, n_mb, cfg.repeat)
+    finally:
+        if not cfg.work_dir:
+            path.remove_tree(work_dir)
+
+    save({'host': util.get_hostname(), 'python': sys.version, 'time': util.get_time()['dt'], 'results': results},
+         cfg.out, 'json', indent=2)
+    n_fault = 0
+    if cfg.baseline:
+        baseline = load(cfg.baseline, 'json')
+        if baseline is None:
+            log.error(f'Baseline results not found: {cfg.baseline}')
+        else:
+            for case, metric, prev, curr in compare(results, baseline, cfg.tolerance / 100):
+                log.warning(f'Regression: {case} {metric}: {prev:.4g} -> {curr:.4g}')
+                n_fault += 1
+    log.info(f'Finished. Cases run: {len(results)}. Regressions: {n_fault}. Results: {cfg.out}')
+    sys.exit(1 if n_fault else 0)
@@ -3,6 +3,13 @@ import os
 import shutil
 import stat
 import re
+import time
+import errno
+import fnmatch
+import itertools
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
 import humanize
 # import subprocess
 import util
@@ -11,27 +18,171 @@ import log_util
 log = log_util.get_logger(__name__, level="INFO")
 
 
+def scan_dir(path2dir):
+    """List folder entries. Return: list of os.DirEntry ([] if folder can't be read)"""
+    try:
+        with os.scandir(path2dir) as it:
+            return list(it)
+    except OSError as e:
+        log.debug(f"Can't scan {path2dir}: {e}")
+        return []
+
+
+def walk(top, include=None, exclude=None, prune=None, files=True, dirs=True, follow_symlinks=False, n_workers=1,
+         max_depth=None):
+    """
+    Walk into folder hierarchy, yield os.DirEntry of every item lazily (entries keep cached stat data).
+    include -- function(entry): yield only entries it returns True for
+    exclude -- function(entry): don't yield entries it returns True for
+    prune -- function(entry): don't walk into folders it returns True for
+    files, dirs -- yield files (everything which isn't a folder), folders
+    follow_symlinks -- walk into symlinked folders (symlink loops aren't detected)
+    n_workers -- number of threads scanning folders concurrently (for network file systems). Order of entries isn't
+        defined when > 1
+    max_depth -- don't walk deeper: 1 - 'top' content only, None - no limit
+    """
+    def select(entries, depth):
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+            except OSError:
+                is_dir = False
+            if (dirs if is_dir else files) and (include is None or include(entry)) and not (exclude and exclude(entry)):
+                yield entry
+            if is_dir and (max_depth is None or depth < max_depth) and not (prune and prune(entry)):
+                subdirs.append((entry.path, depth + 1))
+
+    subdirs = []
+    if n_workers <= 1:
+        stack = [(top, 1)]
+        while stack:
+            foo, depth = stack.pop()
+            try:
+                it = os.scandir(foo)
+            except OSError as e:
+                log.debug(f"Can't scan {foo}: {e}")
+                continue
+            with it:
+                yield from select(it, depth)
+            stack += reversed(subdirs)
+            subdirs.clear()
+        return
+
+    with ThreadPoolExecutor(n_workers) as executor:
+        pending = {executor.submit(scan_dir, top): 1}
+        while pending:
+            done, foo = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from select(future.result(), pending.pop(future))
+            pending.update({executor.submit(scan_dir, item): depth for item, depth in subdirs})
+            subdirs.clear()
+
+
 def get_dir_content(dir):
     """Walk into folder hierarchy, generate list of files"""
     total_files = []
     total_subdirs = []
-    for root, subdirs, files in os.walk(dir):
-        # print(root, subdirs)
-        for filename in files:
-            item = osp.join(root, filename)
-            if item not in total_files:
-                total_files.append(item)
-        for subdir in subdirs:
-            item = osp.join(root, subdir)
-            if item not in total_subdirs:
-                total_subdirs.append(item)
+    for entry in walk(dir):
+        (total_subdirs if entry.is_dir() else total_files).append(entry.path)
     return total_files, total_subdirs
 
 
-def getsize(path):
-    """Disk size in human readable format"""
-    return humanize.naturalsize(os.stat(path).st_size)
-    # return subprocess.check_output(['du', '-sh', path]).split()[0].decode('utf-8')
+du_cache = {}  # {folder: (mtime_ns, size, blocks, n_files, hard links {(dev, ino): (size, blocks)}, subfolders)}
+
+
+def get_dir_usage(path2dir):
+    """
+    Disk usage of folder items (not recursive): files and subfolder inodes. Cached until folder mtime changes
+    (i.e. items are added/removed/renamed: size change of file rewritten in place isn't detected)
+    Return:
+        (mtime_ns, size, blocks, n_files, hard links {(dev, ino): (size, blocks)}, subfolders) or None
+    """
+    try:
+        mtime_ns = os.stat(path2dir).st_mtime_ns
+    except OSError:
+        return None
+    foo = du_cache.get(path2dir)
+    if foo is not None and foo[0] == mtime_ns:
+        return foo
+    size = blocks = n_files = 0
+    links = {}
+    subdirs = []
+    for entry in scan_dir(path2dir):
+        try:
+            bar = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if stat.S_ISDIR(bar.st_mode):
+            subdirs.append(entry.path)
+        elif bar.st_nlink > 1:  # hard linked: count once per tree
+            links[(bar.st_dev, bar.st_ino)] = (bar.st_size, bar.st_blocks * 512)
+            n_files += 1
+            continue
+        else:
+            n_files += 1
+        size += bar.st_size
+        blocks += bar.st_blocks * 512
+    foo = du_cache[path2dir] = (mtime_ns, size, blocks, n_files, links, subdirs)
+    return foo
+
+
+def get_disk_usage(path2item, n_workers=8):
+    """
+    Recursive disk usage (as 'du'): folders are scanned concurrently by 'n_workers' threads, per folder results are
+    cached (see get_dir_usage()), hard links are counted once.
+    Return:
+        dict {'size': apparent size, 'blocks': allocated size, 'n_files', 'n_dirs'}, bytes. None if item doesn't exist
+    Symlink to file given as 'path2item' is followed (symlinks inside folders are counted as links).
+    """
+    try:
+        foo = os.lstat(path2item)
+    except OSError:
+        return None
+    if stat.S_ISLNK(foo.st_mode):
+        try:
+            bar = os.stat(path2item)
+        except OSError:
+            bar = foo  # broken link
+        if not stat.S_ISDIR(bar.st_mode):
+            foo = bar
+    usage = {'size': foo.st_size, 'blocks': foo.st_blocks * 512, 'n_files': 0, 'n_dirs': 0}
+    if not stat.S_ISDIR(foo.st_mode):
+        usage['n_files'] = 1
+        return usage
+    links = {}
+
+    def add(item):
+        if item is None:
+            return []
+        usage['size'] += item[1]
+        usage['blocks'] += item[2]
+        usage['n_files'] += item[3]
+        usage['n_dirs'] += 1
+        links.update(item[4])
+        return item[5]
+
+    if n_workers <= 1:
+        stack = [path2item]
+        while stack:
+            stack += add(get_dir_usage(stack.pop()))
+    else:
+        with ThreadPoolExecutor(n_workers) as executor:
+            pending = {executor.submit(get_dir_usage, path2item)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending |= {executor.submit(get_dir_usage, item) for item in add(future.result())}
+    for size, blocks in links.values():
+        usage['size'] += size
+        usage['blocks'] += blocks
+    return usage
+
+
+def getsize(path, allocated=False):
+    """Disk size (recursive for folder, see get_disk_usage()) in human readable format. None if path doesn't exist
+    allocated -- allocated size (as 'du') instead of apparent one"""
+    foo = get_disk_usage(path)
+    return humanize.naturalsize(foo['blocks' if allocated else 'size']) if foo is not None else None
 
 
 def mkdir(path):
@@ -44,45 +195,624 @@ def mkdir(path):
             log.info('Folder: \'%s\' already exists.' % path)
 
 
-def find_patt(dir, pattern='.*'):
-    """Find items inside folder matching given RE pattern"""
+def compile_patterns(patterns, glob=False):
+    """Compile RE (or glob when 'glob') pattern or list of them. Compiled patterns are kept as is"""
+    return [
+        item if isinstance(item, re.Pattern) else re.compile(fnmatch.translate(item) if glob else item)
+        for item in util.to_list(patterns)]
+
+
+def iter_patt(dir, patterns='.*', glob=False, basename=False, max_depth=None, prune=None, files=True, dirs=True,
+              n_workers=1):
+    """
+    Walk into folder and yield paths of items matching any of patterns as they are found.
+    patterns -- RE pattern (glob when 'glob'), compiled pattern or list of them. RE is searched in path, glob should
+        match the whole path
+    basename -- match patterns against item name instead of full path
+    max_depth -- don't walk deeper: 1 - 'dir' content only
+    prune -- folders not to walk into: function(entry) or pattern(s) matched against folder name as globs
+        (e.g. ['.git', 'work*']) or compiled RE
+    files, dirs, n_workers -- see walk()
+    """
+    patterns = compile_patterns(patterns, glob)
+    key = (lambda entry: entry.name) if basename else (lambda entry: entry.path)
+    if len(patterns) == 1:
+        search = patterns[0].search if not glob else patterns[0].match
+        include = (lambda entry: search(key(entry))) if patterns[0].pattern not in ('.*', '') else None
+    else:
+        include = lambda entry: any((item.match if glob else item.search)(key(entry)) for item in patterns)
+    if prune is not None and not callable(prune):
+        prune_patterns = compile_patterns(prune, glob=True)
+        prune = lambda entry: any(item.match(entry.name) for item in prune_patterns)
+    for entry in walk(dir, include, prune=prune, files=files, dirs=dirs, n_workers=n_workers, max_depth=max_depth):
+        yield entry.path
+
+
+def find_patt(dir, pattern='.*', max_count=None, index=None, **kwargs):
+    """
+    Find items inside folder matching given RE pattern (see iter_patt() for pattern kinds, depth and prune options)
+    max_count -- stop search after this number of items found
+    index -- FileIndex of tree containing 'dir' to answer from instead of walking (see FileIndex.find())
+    """
     if not osp.isdir(dir):
         return None
-    items_found = []
-    dir_files, dir_subdirs = get_dir_content(dir)
-    for item in dir_files + dir_subdirs:
-        foo = re.search(pattern, item)
-        if foo:
-            items_found.append(item)
-    return items_found
+    if index is not None:
+        kwargs.pop('n_workers', None)  # nothing to walk
+        return list(itertools.islice(index.find(pattern, dir=dir, **kwargs), max_count))
+    return list(itertools.islice(iter_patt(dir, pattern, **kwargs), max_count))
+
+
+fd_ops_supported = os.scandir in os.supports_fd and {os.open, os.unlink, os.rmdir} <= os.supports_dir_fd
+
+
+def add_mode(path2item, mode, dir_fd=None):
+    """Add permission bits to item (path or fd) mode"""
+    os.chmod(path2item, stat.S_IMODE(os.stat(path2item, dir_fd=dir_fd).st_mode) | mode, dir_fd=dir_fd)
+
+
+def retry_chmod(func, path2item, dir_fd=None):
+    """Call func(path2item, dir_fd=..) for item of tree being removed. On permission error add owner permissions to
+    folder dir_fd (inside the tree) and to folder opened by open_dir() and call it again. Folder containing the tree
+    root (dir_fd is None) is never touched: the error is raised"""
+    try:
+        return func(path2item, dir_fd=dir_fd)
+    except PermissionError:
+        if dir_fd is None and func is not open_dir:
+            raise
+        if dir_fd is not None:
+            add_mode(dir_fd, stat.S_IWUSR | stat.S_IXUSR)
+        if func is open_dir:
+            add_mode(path2item, stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR, dir_fd)
+        return func(path2item, dir_fd=dir_fd)
+
+
+def open_dir(name, dir_fd=None):
+    return os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=dir_fd)
+
+
+def remove_subtree_fd(name, dir_fd=None):
+    """Remove folder 'name' (relative to dir_fd) with its content using fd-relative calls: no path lookups"""
+    fd = retry_chmod(open_dir, name, dir_fd)
+    try:
+        with os.scandir(fd) as it:
+            entries = list(it)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                remove_subtree_fd(entry.name, fd)
+            else:
+                retry_chmod(os.unlink, entry.name, fd)
+    finally:
+        os.close(fd)
+    retry_chmod(os.rmdir, name, dir_fd)
+
+
+def remove_files_fd(name, dir_fd=None, inline=False):
+    """Remove files of folder 'name' (relative to dir_fd). Folder without subfolders is removed as well, as the whole
+    subtree when 'inline'.
+    Return: None if folder is removed, (fd of open folder, list of its subfolders) otherwise"""
+    if inline:
+        remove_subtree_fd(name, dir_fd)
+        return None
+    fd = retry_chmod(open_dir, name, dir_fd)
+    try:
+        with os.scandir(fd) as it:
+            entries = list(it)
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            else:
+                retry_chmod(os.unlink, entry.name, fd)
+    except BaseException:
+        os.close(fd)
+        raise
+    if subdirs:
+        return fd, subdirs
+    os.close(fd)
+    retry_chmod(os.rmdir, name, dir_fd)
+    return None
+
+
+def remove_tree(path2dir, n_workers=8):
+    """Remove folder with its content. Subfolders at any depth are removed concurrently by 'n_workers' threads.
+    Permissions are fixed only for items which fail to be removed"""
+    if not fd_ops_supported:
+        def onerror(func, path2item, exc_info):
+            if isinstance(exc_info[1], FileNotFoundError):  # already removed by nested rmtree()
+                return
+            if not isinstance(exc_info[1], PermissionError):
+                raise exc_info[1]
+            if func in (os.scandir, os.open, os.listdir):  # folder inside the tree can't be listed
+                add_mode(path2item, stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR)
+                shutil.rmtree(path2item, onerror=onerror)
+            elif osp.abspath(path2item) != osp.abspath(path2dir):  # containing folder is inside the tree
+                add_mode(osp.dirname(path2item), stat.S_IWUSR | stat.S_IXUSR)
+                if func in (os.unlink, os.remove) and not osp.islink(path2item):
+                    add_mode(path2item, stat.S_IWRITE)  # read-only file (Windows)
+                func(path2item)
+            else:
+                raise exc_info[1]
+        shutil.rmtree(path2dir, onerror=onerror)
+        return
+    if n_workers <= 1:
+        remove_subtree_fd(path2dir)
+        return
+    max_open = 32 * n_workers  # folders with subfolders in progress keep their fd open: beyond that remove inline
+    nodes = {}  # {folder fd: [number of subfolders in progress, name, parent fd]}
+
+    def done(name, parent_fd):
+        """Folder 'name' is removed: remove its parent when the last subfolder is done"""
+        while parent_fd is not None:
+            node = nodes[parent_fd]
+            node[0] -= 1
+            if node[0] > 0:
+                return
+            del nodes[parent_fd]
+            os.close(parent_fd)
+            name, parent_fd = node[1], node[2]
+            retry_chmod(os.rmdir, name, parent_fd)
+
+    with ThreadPoolExecutor(n_workers) as executor:
+        pending = {executor.submit(remove_files_fd, path2dir): (path2dir, None)}
+        try:
+            while pending:
+                finished, foo = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, parent_fd = pending.pop(future)
+                    bar = future.result()
+                    if bar is None:  # removed completely
+                        done(name, parent_fd)
+                        continue
+                    fd, subdirs = bar
+                    nodes[fd] = [len(subdirs), name, parent_fd]
+                    for item in subdirs:
+                        pending[executor.submit(remove_files_fd, item, fd, len(nodes) >= max_open)] = (item, fd)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            for fd in nodes:
+                os.close(fd)
+            raise
+
+
+trash_executor = None  # background remover of folders moved to trash
+trash_futures = []
+
+
+def move2trash(path2dir, n_workers=8):
+    """Rename folder out of the way (next to it: atomic, the same file system) and remove it in background thread.
+    Return: trash path"""
+    global trash_executor
+    path2dir = osp.abspath(path2dir)
+    foo = osp.join(osp.dirname(path2dir), f'.trash_{osp.basename(path2dir)}_{os.getpid()}_{time.time_ns()}')
+    os.rename(path2dir, foo)
+    if trash_executor is None:
+        trash_executor = ThreadPoolExecutor(1, thread_name_prefix='trash')
+    trash_futures.append(trash_executor.submit(remove_tree, foo, n_workers))
+    return foo
+
 
+def wait_trash():
+    """Wait for background removal of folders moved to trash. Return: number of failed removals"""
+    n_fault = 0
+    while trash_futures:
+        foo = trash_futures.pop(0).exception()
+        if foo is not None:
+            log.error(f"Can't remove trash: {foo}")
+            n_fault += 1
+    return n_fault
 
-def remove(path):
-    """Remove items"""
+
+def remove(path, trash=False, n_workers=8):
+    """
+    Remove items
+    trash -- rename folders out of the way and remove them in background (see wait_trash())
+    n_workers -- number of threads removing subfolders
+    """
     item2remove = util.to_list(path)
     for item in item2remove:
         log.info('Removing %s ...' % item)
-        if osp.exists(item):
-            os.chmod(item, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-            if osp.isfile(item):
-                os.remove(item)
-            elif osp.isdir(item):
-                shutil.rmtree(item)
+        try:
+            foo = os.lstat(item)
+        except FileNotFoundError:
+            continue
+        try:
+            if not stat.S_ISDIR(foo.st_mode):
+                try:
+                    os.unlink(item)
+                except PermissionError:
+                    if stat.S_ISLNK(foo.st_mode):  # chmod() would change link target
+                        raise
+                    add_mode(item, stat.S_IWRITE)  # read-only file can't be removed on Windows
+                    os.unlink(item)
+            elif trash:
+                move2trash(item, n_workers)
             else:
-                log.error('Can\'t remove %s' % item)
+                remove_tree(item, n_workers)
+        except OSError as e:
+            log.error('Can\'t remove %s: %s' % (item, e))
+
+
+def hash_file(path2file, algorithm='sha1', chunk_size=1 << 20):
+    """Hash file content read by chunks into reused buffer. Return: hex digest"""
+    foo = hashlib.new(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path2file, 'rb', buffering=0) as fid:
+        while True:
+            n = fid.readinto(buf)
+            if not n:
+                return foo.hexdigest()
+            foo.update(view[:n])
+
+
+def copy_file_data(src, dst):
+    """Copy file content inside kernel: os.copy_file_range() (shares blocks on CoW file systems), falls back to
+    shutil.copyfile() (uses os.sendfile() on Linux)"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+                raise
+    shutil.copyfile(src, dst)
+
+
+def is_copy_fresh(src, dst, src_stat, use_hash=False):
+    """Whether destination file has the same size and mtime as source (the same content hash when 'use_hash')"""
+    try:
+        foo = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    return foo.st_size == src_stat.st_size and (
+        hash_file(src) == hash_file(dst) if use_hash else foo.st_mtime_ns == src_stat.st_mtime_ns)
+
+
+def copy_file(src, dst, src_stat, incremental=False, use_hash=False):
+    """
+    Copy file with its permissions and times (as shutil.copy2()).
+    incremental -- skip file if it's fresh (see is_copy_fresh())
+    Return: True if copied, False if skipped
+    """
+    if incremental and is_copy_fresh(src, dst, src_stat, use_hash):
+        return False
+    copy_file_data(src, dst)
+    shutil.copystat(src, dst)
+    return True
+
+
+class CopyStats(object):
+    """Class "CopyStats" - copy progress: files/bytes copied and skipped, throughput. Logs progress periodically"""
+
+    def __init__(self, progress_interval=10):
+        self.n_files = 0
+        self.n_skipped = 0
+        self.n_bytes = 0
+        self.n_bytes_skipped = 0
+        self.tme = time.perf_counter()
+        self.progress_interval = progress_interval
+        self.progress_tme = self.tme
+
+    def add(self, copied, size):
+        if copied:
+            self.n_files += 1
+            self.n_bytes += size
+        else:
+            self.n_skipped += 1
+            self.n_bytes_skipped += size
+        if self.progress_interval and time.perf_counter() - self.progress_tme >= self.progress_interval:
+            self.progress_tme = time.perf_counter()
+            log.info(f'Copying ... {self}')
+
+    def get(self):
+        dur = time.perf_counter() - self.tme
+        return {'n_files': self.n_files, 'n_skipped': self.n_skipped, 'n_bytes': self.n_bytes,
+                'n_bytes_skipped': self.n_bytes_skipped, 'dur': dur, 'mbps': self.n_bytes / dur / 1e6 if dur else None}
+
+    def __str__(self):
+        foo = self.get()
+        return (f"copied {foo['n_files']} files ({humanize.naturalsize(foo['n_bytes'])}), skipped {foo['n_skipped']} "
+                f"({humanize.naturalsize(foo['n_bytes_skipped'])}), {foo['dur']:.1f}s, {foo['mbps']:.1f} MB/s")
+
+
+def copy_tree(src_path, dst_path, stats, incremental=False, use_hash=False, n_workers=8):
+    """Copy folder content into (existing) destination folder using thread pool. Symlinks are followed as
+    shutil.copytree() does"""
+    os.makedirs(dst_path, exist_ok=True)
+    subdirs = [(src_path, dst_path)]
+    pending = {}
+    with ThreadPoolExecutor(n_workers) as executor:
+        for entry in walk(src_path, follow_symlinks=True):
+            foo = osp.join(dst_path, osp.relpath(entry.path, src_path))
+            if entry.is_dir():
+                os.makedirs(foo, exist_ok=True)
+                subdirs.append((entry.path, foo))
+                continue
+            bar = entry.stat()
+            if incremental and not use_hash and is_copy_fresh(entry.path, foo, bar):  # cheap check: no thread hop
+                stats.add(False, bar.st_size)
+                continue
+            pending[executor.submit(copy_file, entry.path, foo, bar, incremental, use_hash)] = bar.st_size
+            if len(pending) >= n_workers * 64:
+                done, foo = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stats.add(future.result(), pending.pop(future))
+        for future in as_completed(pending):
+            stats.add(future.result(), pending[future])
+    for src, dst in reversed(subdirs):  # after files copying, which changes folder mtime
+        shutil.copystat(src, dst)
 
 
-def copy(src_path, dst_path):
-    """Copy files & folders"""
+def copy(src_path, dst_path, incremental=False, use_hash=False, n_workers=8, progress_interval=10):
+    """
+    Copy files & folders. Folder is copied into 'dst_path' (existing destination folder is updated).
+    incremental -- skip files whose destination has the same size and mtime (content hash when 'use_hash')
+    n_workers -- number of threads copying files
+    progress_interval -- log progress every this number of seconds (0 - don't)
+    Return: dict {'n_files', 'n_skipped', 'n_bytes', 'n_bytes_skipped', 'dur', 'mbps'}
+    """
+    stats = CopyStats(progress_interval)
     item2copy = util.to_list(src_path)
     for src_path in item2copy:
-        log.debug('Copying %s (%s) to %s' % (src_path, getsize(src_path), dst_path))
+        log.debug('Copying %s to %s' % (src_path, dst_path))
         if osp.isfile(src_path):
-            shutil.copy(src_path, dst_path)
+            foo = osp.join(dst_path, osp.basename(src_path)) if osp.isdir(dst_path) else dst_path
+            bar = os.stat(src_path)
+            stats.add(copy_file(src_path, foo, bar, incremental, use_hash), bar.st_size)
         elif osp.isdir(src_path):
-            if not osp.exists(dst_path):
-                shutil.copytree(src_path, dst_path)
-            else:
-                log.error('Destination folder path %s must not exist!' % dst_path)
+            if osp.exists(dst_path) and not osp.isdir(dst_path):
+                log.error('Destination path %s must be a folder!' % dst_path)
+                continue
+            copy_tree(src_path, dst_path, stats, incremental, use_hash, n_workers)
         else:
             log.error('Can\'t copy %s to %s' % (src_path, dst_path))
+    log.info(f'Copy finished: {stats}')
+    return stats.get()
+
+
+def hash_tree(path2dir, prev=None, algorithm='sha1', chunk_size=1 << 20, n_workers=8, use_processes=False):
+    """
+    Hash content of every regular file of folder tree concurrently.
+    prev -- previous manifest of the tree: files with unchanged (size, mtime) take hash from it without reading
+    n_workers, use_processes -- number of hashing threads (processes when 'use_processes')
+    Return:
+        manifest dict {'root', 'algorithm', 'files': {relative path: {'size', 'mtime_ns', 'hash'}}}. Can be stored
+        by file.save(manifest, path2file, 'json'). 'hash' is None for files which couldn't be read
+    """
+    path2dir = osp.abspath(path2dir)
+    prev_files = prev['files'] if prev is not None and prev.get('algorithm') == algorithm else {}
+    files = {}
+    pending = {}
+    n_bytes = 0
+    tme = time.perf_counter()
+
+    def collect(done):
+        for future in done:
+            item = pending.pop(future)
+            try:
+                files[item]['hash'] = future.result()
+            except OSError as e:  # removed/unreadable meanwhile: stays unhashed
+                log.warning(f"Can't hash {item}: {e}")
+
+    executor = (ProcessPoolExecutor if use_processes else ThreadPoolExecutor)(n_workers)
+    with executor:
+        for entry in walk(path2dir, include=lambda entry: entry.is_file(follow_symlinks=False), dirs=False):
+            try:
+                foo = entry.stat(follow_symlinks=False)
+            except OSError:  # removed meanwhile
+                continue
+            item = osp.relpath(entry.path, path2dir)
+            files[item] = {'size': foo.st_size, 'mtime_ns': foo.st_mtime_ns, 'hash': None}
+            bar = prev_files.get(item)
+            if bar is not None and bar['hash'] is not None and bar['size'] == foo.st_size and \
+                    bar['mtime_ns'] == foo.st_mtime_ns:
+                files[item]['hash'] = bar['hash']
+                continue
+            n_bytes += foo.st_size
+            pending[executor.submit(hash_file, entry.path, algorithm, chunk_size)] = item
+            if len(pending) >= n_workers * 64:
+                collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+        collect(list(as_completed(pending)))
+    dur = time.perf_counter() - tme
+    log.info(f'Hashed {path2dir}: {len(files)} files, {humanize.naturalsize(n_bytes)} read, {dur:.1f}s, '
+             f'{n_bytes / dur / 1e6 if dur else 0:.1f} MB/s')
+    return {'root': path2dir, 'algorithm': algorithm, 'files': files}
+
+
+def find_duplicates(manifest):
+    """Return: list of lists of relative paths of non-empty files with the same content (see hash_tree())"""
+    groups = {}
+    for item, foo in manifest['files'].items():
+        if foo['size'] and foo['hash'] is not None:
+            groups.setdefault(foo['hash'], []).append(item)
+    return [sorted(item) for item in groups.values() if len(item) > 1]
+
+
+def diff_manifests(old, new):
+    """
+    Compare tree manifests (see hash_tree()). Unhashed file is changed unless its size and mtime are the same.
+    Return:
+        dict {'added', 'removed', 'changed', 'unhashed': lists of relative paths, 'duplicates': find_duplicates(new)}
+    """
+    foo, bar = old['files'], new['files']
+
+    def is_changed(item):
+        if foo[item]['hash'] is not None and bar[item]['hash'] is not None:
+            return foo[item]['hash'] != bar[item]['hash']
+        return (foo[item]['size'], foo[item]['mtime_ns']) != (bar[item]['size'], bar[item]['mtime_ns'])
+    return {
+        'added': sorted(item for item in bar if item not in foo),
+        'removed': sorted(item for item in foo if item not in bar),
+        'changed': sorted(item for item in bar if item in foo and is_changed(item)),
+        'unhashed': sorted(item for item in bar if bar[item]['hash'] is None),
+        'duplicates': find_duplicates(new)}
+
+
+index_cache_dir = osp.join(osp.expanduser('~'), '.cache', 'scrpt', 'index')
+
+
+def subtree_range(path2dir):
+    """(low, high) bounds of paths inside folder for range queries: low < path < high"""
+    foo = path2dir if path2dir.endswith('/') else path2dir + '/'
+    return foo, foo[:-1] + chr(ord('/') + 1)
+
+
+def glob2sql(pattern):
+    """fnmatch glob to SQLite GLOB pattern"""
+    return pattern.replace('[!', '[^')
+
+
+class FileIndex(object):
+    """
+    Class "FileIndex" - SQLite index of folder tree: path, size, mtime and inode of every item.
+    refresh() rescans only folders whose mtime changed, i.e. items were added/removed/renamed there. Files rewritten in
+    place don't change folder mtime: use refresh(full=True) to catch them.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS entries (
+            path TEXT PRIMARY KEY, parent TEXT, name TEXT, is_dir INTEGER, size INTEGER, mtime_ns INTEGER, ino INTEGER);
+        CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+        CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER);
+    """
+
+    def __init__(self, root, path2db=None):
+        """
+        root -- folder to be indexed
+        path2db -- index file. Default: ~/.cache/scrpt/index/<root path hash>.sqlite
+        """
+        self.root = osp.abspath(root)
+        if path2db is None:
+            os.makedirs(index_cache_dir, exist_ok=True)
+            path2db = osp.join(index_cache_dir, hashlib.sha1(self.root.encode()).hexdigest()[:16] + '.sqlite')
+        self.path2db = path2db
+        self.db = sqlite3.connect(path2db)
+        self.db.executescript(self.schema)
+        self.db.create_function('regexp', 2, lambda pattern, item: re.search(pattern, item) is not None,
+                                deterministic=True)
+
+    def scan(self, path2dir):
+        """Return: {path: (name, is_dir, size, mtime_ns, ino)} of folder items"""
+        items = {}
+        for entry in scan_dir(path2dir):
+            try:
+                foo = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            items[entry.path] = (entry.name, int(stat.S_ISDIR(foo.st_mode)), foo.st_size, foo.st_mtime_ns, foo.st_ino)
+        return items
+
+    def remove_subtree(self, path2dir):
+        """Remove folder content from index. Return: list of removed paths"""
+        low, high = subtree_range(path2dir)
+        removed = [item for item, in self.db.execute('SELECT path FROM entries WHERE path > ? AND path < ?', (low, high))]
+        self.db.execute('DELETE FROM entries WHERE path > ? AND path < ?', (low, high))
+        self.db.execute('DELETE FROM dirs WHERE path = ? OR (path > ? AND path < ?)', (path2dir, low, high))
+        return removed
+
+    def refresh(self, full=False):
+        """
+        Update index: rescan folders whose mtime changed (every folder when 'full').
+        Return:
+            dict {'added': [...], 'removed': [...], 'changed': [...]} - paths changed since previous refresh
+        """
+        changes = {'added': [], 'removed': [], 'changed': []}
+        known = dict(self.db.execute('SELECT path, mtime_ns FROM dirs'))
+        stack = [self.root]
+        with self.db:
+            while stack:
+                foo = stack.pop()
+                try:
+                    mtime_ns = os.stat(foo).st_mtime_ns  # before scan: folder changed during scan is rescanned next time
+                except OSError:
+                    changes['removed'] += self.remove_subtree(foo)
+                    continue
+                if not full and known.get(foo) == mtime_ns:
+                    stack += [item for item, in self.db.execute(
+                        'SELECT path FROM entries WHERE parent = ? AND is_dir = 1', (foo,))]
+                    continue
+
+                old = {item[0]: item[1:] for item in self.db.execute(
+                    'SELECT path, name, is_dir, size, mtime_ns, ino FROM entries WHERE parent = ?', (foo,))}
+                new = self.scan(foo)
+                for item, bar in old.items():
+                    if item not in new or new[item][1] != bar[1]:
+                        changes['removed'].append(item)
+                        if bar[1]:
+                            changes['removed'] += self.remove_subtree(item)
+                    elif new[item] != bar and not bar[1]:
+                        changes['changed'].append(item)
+                changes['added'] += [item for item in new if item not in old or new[item][1] != old[item][1]]
+                self.db.execute('DELETE FROM entries WHERE parent = ?', (foo,))
+                self.db.executemany(
+                    'INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)', [(item, foo) + bar for item, bar in new.items()])
+                self.db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?)', (foo, mtime_ns))
+                stack += [item for item, bar in new.items() if bar[1]]
+        return changes
+
+    def find(self, pattern='.*', glob=False, basename=False, files=True, dirs=True, dir=None, max_depth=None,
+             prune=None):
+        """
+        Yield indexed paths inside 'dir' (default: root) matching any of patterns, see iter_patt().
+        Globs are matched by SQLite, RE patterns are searched by Python callback.
+        prune -- folder name glob(s) or compiled RE: items inside matching folders are skipped (callable isn't
+            supported: there are no DirEntry objects in index)
+        """
+        assert not callable(prune), "FileIndex.find(): 'prune' should be pattern(s), not function"
+        low, high = subtree_range(osp.abspath(dir) if dir else self.root)
+        query = 'SELECT path FROM entries WHERE path > ? AND path < ?'
+        params = [low, high]
+        if not (files and dirs):
+            query += ' AND is_dir = ?'
+            params.append(int(dirs))
+        key = 'name' if basename else 'path'
+        conditions = []
+        for item in util.to_list(pattern):
+            if glob and not isinstance(item, re.Pattern):
+                conditions.append(f'{key} GLOB ?')
+                params.append(glob2sql(item))
+            elif isinstance(item, re.Pattern):
+                conditions.append(f'regexp(?, {key})')
+                params.append(item.pattern)
+            elif item not in ('.*', ''):
+                conditions.append(f'regexp(?, {key})')
+                params.append(item)
+            else:  # matches everything
+                conditions = []
+                break
+        if conditions:
+            query += f" AND ({' OR '.join(conditions)})"
+        prune = compile_patterns(prune, glob=True) if prune is not None else []
+        for item, in self.db.execute(query, params):
+            if max_depth is not None or prune:
+                foo = item[len(low):].split('/')
+                if max_depth is not None and len(foo) > max_depth:
+                    continue
+                if prune and any(bar.match(name) for name in foo[:-1] for bar in prune):
+                    continue
+            yield item
+
+    def getsize(self, dir=None):
+        """Total size of indexed files inside 'dir' (default: root), bytes"""
+        low, high = subtree_range(osp.abspath(dir) if dir else self.root)
+        return self.db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries WHERE path > ? AND path < ? AND is_dir = 0', (low, high)).fetchone()[0]
+
+    def get(self, path2item):
+        """Return: dict {'path', 'is_dir', 'size', 'mtime_ns', 'ino'} of indexed item or None"""
+        foo = self.db.execute(
+            'SELECT path, is_dir, size, mtime_ns, ino FROM entries WHERE path = ?', (osp.abspath(path2item),)).fetchone()
+        return dict(zip(('path', 'is_dir', 'size', 'mtime_ns', 'ino'), foo)) if foo else None
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
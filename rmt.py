@@ -26,7 +26,15 @@ def configure(cfg_):
     global cfg  # remote host config
     global rmtc  # fabric.connection instance
     cfg = {key: cfg_[key] for key in ['host', 'user', 'password']}
-    rmtc = Connection(host=cfg['host'], user=cfg['user'], connect_kwargs={'password': cfg['password']}, connect_timeout=10)
+    rmtc = connect(cfg)
+
+
+def connect(cfg_):
+    """Create new fabric.Connection to remote host. Used to keep connections to several hosts at once
+    cfg_ - dict containing 'host', 'user' and optional 'password' fields
+    """
+    connect_kwargs = {'password': cfg_['password']} if cfg_.get('password') else {}
+    return Connection(host=cfg_['host'], user=cfg_.get('user'), connect_kwargs=connect_kwargs, connect_timeout=10)
 
 
 def run(cmd):
@@ -60,7 +68,7 @@ def upload(localpath, remotepath=''):
 
         uploaded = []
         for remote_item, local_item in zip(remote_path_list, local_path_list):
-            if path.isfile(local_item):
+            if os.path.isfile(local_item):
                 log.info('%s will be uploaded to %s::/%s' % (path.getsize(local_item), cfg['host'], remote_item))
                 res = rmtc.put(local_item, remote_item)
                 log.info('Uploaded %s to %s' % (res.local, res.remote))
@@ -5,7 +5,13 @@ import os
 import socket
 import datetime
 import time
+import signal
+import asyncio
+import threading
+import functools
 import subprocess
+from array import array
+from collections import deque
 
 import log_util
 
@@ -70,26 +76,131 @@ def parse_opt(opts, opt_line=''):
     return opts
 
 
-def subprocess_call(cmd, shl=True):
-    """TODO: need to rethink/rewrite this util"""
-    cmd_list = to_list(cmd)
-    for cmd in cmd_list:
-        log.debug(cmd)
-        # if cfg['print_cmd']:
-        #     continue
-        if 'shutdown' in cmd:  # close log file if command='shutdown ...'
+def subprocess_call(cmd, shl=True, cwd=None):
+    """Run command(s) one by one, log their output (see run_cmds())
+    cwd - working directory of command
+    return - subprocess.CompletedProcess with whole output for single command, list of them for list of commands.
+        Every output line is '\n' terminated ('\r\n' line ends are converted)"""
+    completed = []
+    for foo in to_list(cmd):
+        if 'shutdown' in foo:  # close log file if command='shutdown ...'
             log_util.shutdown()
-            subprocess.run(
-                cmd, shell=shl, stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT, universal_newlines=True)
-        else:
-            foo = subprocess.run(
-                cmd, shell=shl, stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT, universal_newlines=True)
-            stdout = foo.stdout.split('\n')
-            for item in stdout:
-                log.debug(item)
-            return foo
+        bar = run_cmds([foo], shl=shl, cwd=cwd, tail=None)[0]
+        completed.append(subprocess.CompletedProcess(foo, bar['returncode'], ''.join(item + '\n' for item in bar['tail'])))
+    return completed if isinstance(cmd, (list, tuple)) else completed[0]
+
+
+async def stop_process_async(proc, grace=5):
+    """Terminate asyncio subprocess with all its children (it's started as session leader on posix)"""
+    if proc.returncode is None:
+        for step in ('term', 'kill'):  # there is no SIGKILL on Windows
+            try:
+                if os.name == 'posix':
+                    os.killpg(proc.pid, signal.SIGTERM if step == 'term' else signal.SIGKILL)
+                elif step == 'term':
+                    proc.terminate()
+                else:
+                    proc.kill()
+            except ProcessLookupError:
+                break
+            try:
+                await asyncio.wait_for(proc.wait(), grace)
+                break
+            except asyncio.TimeoutError:
+                continue
+    await proc.wait()
+
+
+async def run_cmd_async(cmd, shl=True, cwd=None, timeout=None, idle_timeout=None, tail=100, line_handler=None, cancel=None):
+    """Run command, log its output lines as they arrive
+    cmd - command line (or list of args when shl=False)
+    cwd - working directory of command
+    timeout - kill command running longer than this, seconds
+    idle_timeout - kill command which prints nothing for this time, seconds
+    tail - number of the last output lines to keep (None - keep all)
+    line_handler - function(line) called for every output line. Command is stopped when it returns True
+    cancel - asyncio.Event. Command is stopped when it's set
+    return - dict {'cmd', 'returncode', 'status', 'dur', 'tail'}.
+        status: 'finished', 'stopped' (by line_handler), 'timeout', 'idle_timeout', 'cancelled'
+    """
+    tme = time.perf_counter()
+    result = {'cmd': cmd, 'returncode': None, 'status': 'finished', 'dur': None, 'tail': []}
+    lines = deque(maxlen=tail)
+    opts = {'stdout': subprocess.PIPE, 'stderr': subprocess.STDOUT, 'cwd': cwd, 'limit': 1 << 24,
+            'start_new_session': os.name == 'posix'}
+    if cancel is not None and cancel.is_set():
+        result['status'] = 'cancelled'
+        return result
+    log.debug(cmd)
+    if shl:
+        proc = await asyncio.create_subprocess_shell(cmd, **opts)
+    else:
+        proc = await asyncio.create_subprocess_exec(*to_list(cmd), **opts)
+
+    cancel_wait = asyncio.ensure_future(cancel.wait()) if cancel is not None else None
+    try:
+        while True:
+            wait_time = [idle_timeout] if idle_timeout else []
+            if timeout:
+                wait_time.append(max(timeout - (time.perf_counter() - tme), 0))
+            read = asyncio.ensure_future(proc.stdout.readline())
+            done, foo = await asyncio.wait(
+                [item for item in (read, cancel_wait) if item is not None],
+                timeout=min(wait_time) if wait_time else None, return_when=asyncio.FIRST_COMPLETED)
+            if read not in done:
+                read.cancel()
+                if cancel_wait in done:
+                    result['status'] = 'cancelled'
+                else:
+                    result['status'] = 'timeout' if timeout and time.perf_counter() - tme >= timeout else 'idle_timeout'
+                break
+            line = read.result()
+            if not line:  # output is closed: wait for command exit, it may keep running
+                exit_wait = asyncio.ensure_future(proc.wait())
+                done, foo = await asyncio.wait(
+                    [item for item in (exit_wait, cancel_wait) if item is not None],
+                    timeout=max(timeout - (time.perf_counter() - tme), 0) if timeout else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if exit_wait not in done:
+                    exit_wait.cancel()
+                    result['status'] = 'cancelled' if cancel_wait in done else 'timeout'
+                break
+            line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            lines.append(line)
+            log.debug(line)
+            if line_handler is not None and line_handler(line):
+                result['status'] = 'stopped'
+                break
+    except asyncio.CancelledError:
+        result['status'] = 'cancelled'
+        raise
+    finally:
+        if cancel_wait is not None:
+            cancel_wait.cancel()
+        await stop_process_async(proc)
+        result['returncode'] = proc.returncode
+        result['dur'] = time.perf_counter() - tme
+        result['tail'] = list(lines)
+    return result
+
+
+async def run_cmds_async(cmds, jobs=1, **kwargs):
+    """Run batch of commands, at most 'jobs' of them at once (see run_cmd_async())
+    cmds - list of commands. Item may be a dict {'cmd': .., <run_cmd_async() args>} to override kwargs for the command
+    return - list of run_cmd_async() results in 'cmds' order
+    """
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def run_one(item):
+        opts = dict(kwargs, **item) if isinstance(item, dict) else dict(kwargs, cmd=item)
+        async with semaphore:
+            return await run_cmd_async(**opts)
+    return await asyncio.gather(*[run_one(item) for item in cmds])
+
+
+def run_cmds(cmds, jobs=1, **kwargs):
+    """Run batch of commands, at most 'jobs' of them at once. Blocking wrapper of run_cmds_async()"""
+    return asyncio.run(run_cmds_async(to_list(cmds), jobs, **kwargs))
 
 
 def dict_create_key_hier(foo, keys, type='dict'):
@@ -166,24 +277,144 @@ def get_week(date):
     }
 
 
-start_timestamp = get_time()['now']  # timestamp to be used by get_timedelta
+start_timestamp = datetime.datetime.now()  # timestamp to be used by get_timedelta
 
 
 def get_timedelta(timestamp=None):
-    """ Measure time interval from start timestamp (should be set in advance)"""
+    """ Measure time interval from start timestamp (should be set in advance) and restart it.
+    Use Timer for nested/concurrent intervals"""
     timestamp = start_timestamp if not isinstance(timestamp, datetime.datetime) else timestamp
-    tme = datetime.datetime.now().replace(microsecond=0)
-    set_timestamp()
-    return tme - timestamp
+    return set_timestamp() - timestamp
 
 
 def set_timestamp():
     """ Set timestamp"""
     global start_timestamp
-    start_timestamp = get_time()['now']
+    start_timestamp = datetime.datetime.now()
     return start_timestamp
 
 
+class TimerStats(object):
+    """
+    Class "TimerStats" - collect durations of named timer sections (see Timer).
+    Nested sections are named '<outer>/<inner>', nesting is tracked per thread.
+    """
+
+    def __init__(self):
+        self.samples = {}  # {section: array of durations, ns}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def push(self, name):
+        """Enter section 'name' in current thread. Return: full section name"""
+        try:
+            stack = self.local.stack
+        except AttributeError:
+            stack = self.local.stack = []
+        foo = f'{stack[-1]}/{name}' if stack else name
+        stack.append(foo)
+        return foo
+
+    def pop(self, section, dur):
+        """Leave section entered by push() and store its duration, ns"""
+        self.local.stack.pop()
+        try:
+            self.samples[section].append(dur)
+        except KeyError:
+            with self.lock:
+                self.samples.setdefault(section, array('q')).append(dur)
+
+    def add(self, section, dur):
+        """Store duration (ns) of section measured outside of Timer"""
+        self.push(section)
+        self.pop(section, dur)
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+
+    def get(self, section=None):
+        """
+        Get statistics of section (all sections when None). Durations are in seconds.
+        Return:
+            dict {section: {'count', 'total', 'min', 'max', 'mean', 'p50', 'p95', 'p99'}}
+        """
+        with self.lock:
+            sections = sorted(self.samples) if section is None else [section]
+        stats = {}
+        for name in sections:
+            foo = sorted(self.samples.get(name, ()))
+            if not foo:
+                continue
+            n = len(foo)
+            total = sum(foo)
+            stats[name] = {'count': n, 'total': total / 1e9, 'min': foo[0] / 1e9, 'max': foo[-1] / 1e9,
+                           'mean': total / n / 1e9}
+            for p in (50, 95, 99):
+                stats[name][f'p{p}'] = foo[min(n - 1, (n * p + 99) // 100 - 1)] / 1e9  # nearest rank
+        return stats
+
+    def report(self, unit='ms'):
+        """Return statistics table as text. unit: 's', 'ms' or 'us'"""
+        scale = {'s': 1, 'ms': 1e3, 'us': 1e6}[unit]
+        fields = ('total', 'min', 'mean', 'p50', 'p95', 'p99', 'max')
+        stats = self.get()
+        width = max([len(item) for item in stats] + [len('section')])
+        lines = [f"{'section':<{width}} {'count':>9} " + ' '.join(f'{item + "," + unit:>11}' for item in fields)]
+        for name, foo in stats.items():
+            lines.append(f"{name:<{width}} {foo['count']:>9} " + ' '.join(f'{foo[item] * scale:>11.3f}' for item in fields))
+        return '\n'.join(lines)
+
+
+timer_stats = TimerStats()  # default statistics storage of Timer
+
+
+class Timer(object):
+    """
+    Class "Timer" - perf_counter_ns based timer of named section. Usage:
+        with Timer('name'): ...
+        @Timer('name')
+        def func(): ...
+        foo = Timer('name').start(); ...; foo.stop()
+    One Timer object shouldn't be started again before stop(). Decorated function may be called concurrently.
+    """
+
+    def __init__(self, name, stats=None):
+        self.name = name
+        self.stats = stats if stats is not None else timer_stats
+        self.section = None
+        self.t0 = None
+
+    def start(self):
+        self.section = self.stats.push(self.name)
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def stop(self):
+        """Return: section duration, ns"""
+        foo = time.perf_counter_ns() - self.t0
+        self.stats.pop(self.section, foo)
+        return foo
+
+    __enter__ = start
+
+    def __exit__(self, *args):
+        self.stats.pop(self.section, time.perf_counter_ns() - self.t0)
+
+    def __call__(self, func):
+        stats, name, perf_counter_ns = self.stats, self.name, time.perf_counter_ns
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            section = stats.push(name)
+            t0 = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.pop(section, perf_counter_ns() - t0)
+        return wrapper
+
+
 def sleep(time2sleep=None):
     """Generate pause for 'time2sleep' seconds during execution..."""
     if time2sleep:
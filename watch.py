@@ -0,0 +1,226 @@
+"""File change watcher (Linux): inotify via ctypes. No polling: blocks in poll() while nothing happens"""
+import os
+import os.path as osp
+import re
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+
+import util
+import log_util
+
+log = log_util.get_logger(__name__, level="INFO")
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+default_events = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE  # file is written, moved or removed
+
+event_header = struct.Struct('iIII')  # wd, mask, cookie, len
+
+_libc = None
+
+
+def get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return _libc
+
+
+class Watcher(object):
+    """
+    Class "Watcher" - watch files/folders for changes. Folders are watched recursively: one inotify watch per folder,
+    new folders are added as they appear, so large trees are never rescanned.
+    Usage:
+        with Watcher('/sim/dir', pattern=r'\\.log$') as watcher:
+            for files in watcher:
+                ...
+    """
+
+    def __init__(self, paths, pattern='.*', recursive=True, events=default_events, debounce=0.5, max_delay=10):
+        """
+        paths -- file/folder path or list of them. OSError is raised if any of them can't be watched (e.g. mistyped)
+        pattern -- RE pattern of changed paths to be reported (see path.find_patt())
+        recursive -- watch subfolders
+        events -- inotify events (IN_*) to report. Folder creation is always tracked to watch new subfolders
+        debounce -- report changes after no new events during this time, seconds
+        max_delay -- report changes not later than this time after the first event even if events keep coming, seconds
+        """
+        self.pattern = re.compile(pattern)
+        self.recursive = recursive
+        self.events = events
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.libc = get_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            foo = ctypes.get_errno()
+            raise OSError(foo, os.strerror(foo))
+        self.poll = select.poll()
+        self.poll.register(self.fd, select.POLLIN)
+        self.wds = {}  # {watch descriptor: path}
+        self.n_overflow = 0  # number of kernel event queue overflows (events lost)
+        try:
+            for item in util.to_list(paths):
+                self.add(item, strict=True)
+        except OSError:
+            self.close()
+            raise
+
+    def add_watch(self, path2item, mask, strict=False):
+        """Add inotify watch. strict -- raise OSError if item can't be watched (missing one is skipped otherwise)"""
+        foo = self.libc.inotify_add_watch(self.fd, os.fsencode(path2item), mask)
+        if foo < 0:
+            bar = ctypes.get_errno()
+            if strict:
+                raise OSError(bar, os.strerror(bar), path2item)
+            if bar == errno.ENOSPC:
+                log.error(f'inotify watch limit reached (see /proc/sys/fs/inotify/max_user_watches): {path2item}')
+            elif bar not in (errno.ENOENT, errno.ENOTDIR):  # removed in the meantime
+                log.error(f"Can't watch {path2item}: {os.strerror(bar)}")
+            return None
+        self.wds[foo] = path2item
+        return foo
+
+    def add(self, path2item, strict=False):
+        """
+        Watch file or folder (with its subfolders when recursive).
+        strict -- raise OSError if 'path2item' itself can't be watched (e.g. doesn't exist)
+        Return:
+            list of files found in added folders: new folder files could be written before the watch was set
+        """
+        mask = self.events | IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF
+        if not osp.isdir(path2item):
+            self.add_watch(path2item, mask, strict)
+            return []
+        found = []
+        dirs = [path2item]
+        while dirs:
+            foo = dirs.pop()
+            if self.add_watch(foo, mask, strict and foo == path2item) is None:
+                continue
+            try:
+                with os.scandir(foo) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive:
+                                dirs.append(entry.path)
+                        else:
+                            found.append(entry.path)
+            except OSError:
+                continue
+        return found
+
+    def read_events(self):
+        """
+        Read pending inotify events, add watches for new folders.
+        Return:
+            set of changed paths
+        """
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = event_header.unpack_from(data, offset)
+                offset += event_header.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    self.n_overflow += 1
+                    log.warning('inotify event queue overflow: some changes are lost')
+                    continue
+                if mask & IN_IGNORED:
+                    self.wds.pop(wd, None)
+                    continue
+                parent = self.wds.get(wd)
+                if parent is None:
+                    continue
+                foo = osp.join(parent, name) if name else parent
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive and name:
+                        changed.update(self.add(foo))
+                elif mask & self.events:
+                    changed.add(foo)
+
+    def wait(self, timeout=None):
+        """
+        Wait for changes and collect them until 'debounce' quiet time (or 'max_delay') passes.
+        timeout -- stop waiting for the first change after this time, seconds (None - wait forever)
+        Return:
+            sorted list of changed paths matching pattern (empty on timeout)
+        """
+        changed = set()
+        tme = None
+        while True:
+            if tme is None:
+                wait_time = timeout
+            else:
+                wait_time = min(self.debounce, max(self.max_delay - (time.monotonic() - tme), 0))
+            if not self.poll.poll(None if wait_time is None else wait_time * 1000):
+                if tme is not None or timeout is not None:
+                    break
+                continue
+            foo = [item for item in self.read_events() if self.pattern.search(item)]
+            if foo and tme is None:
+                tme = time.monotonic()
+            changed.update(foo)
+            if tme is not None and time.monotonic() - tme >= self.max_delay:
+                break
+        return sorted(changed)
+
+    def __iter__(self):
+        """Yield lists of changed paths forever"""
+        while True:
+            yield self.wait()
+
+    def close(self):
+        if self.fd >= 0:
+            self.poll.unregister(self.fd)
+            os.close(self.fd)
+            self.fd = -1
+            self.wds = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def watch(paths, handler, pattern='.*', n_changes=None, **kwargs):
+    """
+    Call handler(files) on every batch of changed files (see Watcher)
+    n_changes -- stop after this number of batches (None - run forever)
+    Return: list of handler results
+    """
+    results = []
+    with Watcher(paths, pattern, **kwargs) as watcher:
+        for files in watcher:
+            log.debug(f'Changed: {files}')
+            results.append(handler(files))
+            if n_changes is not None and len(results) >= n_changes:
+                break
+    return results